@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Prefetch
 
 from discobase.models import (
     Artist,
@@ -11,6 +12,7 @@ from discobase.models import (
     RecordFormat,
     Song,
 )
+from discobase.removal import remove_records
 
 
 class RecordAdmin(admin.ModelAdmin):
@@ -20,6 +22,7 @@ class RecordAdmin(admin.ModelAdmin):
     list_display = (
         "id",
         "title",
+        "artists_str",
         "purchase_date",
         "is_digitized",
     )
@@ -40,6 +43,13 @@ class RecordAdmin(admin.ModelAdmin):
     )  # TODO  why tuple and not list
     list_per_page = 50
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_display_data()
+
+    def delete_queryset(self, request, queryset):
+        """Delete the selected records in one batch (see `removal.py`)."""
+        remove_records(queryset)
+
 
 admin.site.register(Record, RecordAdmin)
 
@@ -58,6 +68,15 @@ class TrxCreditAdmin(admin.ModelAdmin):
 
     list_per_page = 50
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .prefetch_related(
+                Prefetch("record", queryset=Record.objects.with_display_data())
+            )
+        )
+
 
 admin.site.register(TrxCredit, TrxCreditAdmin)
 
@@ -79,6 +98,15 @@ class SongAdmin(admin.ModelAdmin):
 
     list_per_page = 100
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .prefetch_related(
+                Prefetch("record", queryset=Record.objects.with_display_data())
+            )
+        )
+
 
 admin.site.register(Song, SongAdmin)
 
@@ -0,0 +1,81 @@
+"""Cache for the trx chart data.
+
+Cached series are keyed by their date range and the current ledger
+version. The version is a random token in the same cache, replaced
+whenever the ledger changes (see the TrxCredit signal receivers in
+`views.py` and `ledger.py`), which invalidates all cached series at once.
+It also serves as ETag of the series api, the time of the change as its
+Last-Modified. The backend is the 'charts' entry in settings.CACHES, it
+has to be shared by all processes (the default database cache is), for
+a change to invalidate the series of every process.
+"""
+
+import uuid
+
+from django.core.cache import caches
+from django.utils import timezone
+
+LEDGER_VERSION_KEY = "trxcredit_ledger_version"
+
+
+def get_chart_cache():
+    return caches["charts"]
+
+
+def _new_version() -> tuple[str, object]:
+    return uuid.uuid4().hex, timezone.now().replace(microsecond=0)
+
+
+def get_ledger_version() -> tuple[str, object]:
+    """Return the current ledger version and the time it was set
+    (and set one, if missing).
+    """
+    cache = get_chart_cache()
+    version = cache.get(LEDGER_VERSION_KEY)
+    if version is None:
+        # add() does not overwrite a version set concurrently
+        cache.add(LEDGER_VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(LEDGER_VERSION_KEY)
+    return version
+
+
+async def aget_ledger_version() -> tuple[str, object]:
+    """Async version of `get_ledger_version`."""
+    cache = get_chart_cache()
+    version = await cache.aget(LEDGER_VERSION_KEY)
+    if version is None:
+        await cache.aadd(LEDGER_VERSION_KEY, _new_version(), timeout=None)
+        version = await cache.aget(LEDGER_VERSION_KEY)
+    return version
+
+
+def bump_ledger_version() -> None:
+    """Invalidate all cached series."""
+    get_chart_cache().set(LEDGER_VERSION_KEY, _new_version(), timeout=None)
+
+
+def get_or_build_series(start_date, end_date, build, version=None) -> dict:
+    """Return the cached series for the date range (of the passed or
+    the current ledger version), or call `build` to build and cache it.
+    """
+    if version is None:
+        version, _ = get_ledger_version()
+    return get_chart_cache().get_or_set(
+        _series_key(version, start_date, end_date), build
+    )
+
+
+async def aget_or_build_series(start_date, end_date, abuild, version=None) -> dict:
+    """Async version of `get_or_build_series`, `abuild` is awaited."""
+    if version is None:
+        version, _ = await aget_ledger_version()
+    key = _series_key(version, start_date, end_date)
+    series = await get_chart_cache().aget(key)
+    if series is None:
+        series = await abuild()
+        await get_chart_cache().aadd(key, series)
+    return series
+
+
+def _series_key(version: str, start_date, end_date) -> str:
+    return f"trxcredit_series:{version}:{start_date or ''}:{end_date or ''}"
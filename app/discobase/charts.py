@@ -1,55 +1,66 @@
-import plotly.graph_objects as go
-import plotly.io as pio
+"""Data for the trx credit chart. The chart itself is drawn in the
+browser (see static/js/trxcredit_chart.js), the server only sends the
+columns of the trx series as compact json.
+"""
 
-pio.templates.default = "simple_white"
+from datetime import date
 
+from discobase.models import TrxCredit
 
-def make_trxcredit_chart(trx):
-    min_date = trx.order_by("trx_date").first().trx_date
-    max_date = trx.order_by("trx_date").last().trx_date
-    color_dict = {"Addition": "green", "Removal": "red", "Purchase": "blue"}
+TRX_COLUMNS = (
+    "id",
+    "trx_date",
+    "credit_saldo",
+    "trx_type",
+    "record_id",
+    "record_string",
+)
 
-    fig = go.Figure(
-        data=go.Scatter(
-            x=[x.trx_date for x in trx],
-            y=[x.credit_saldo for x in trx],
-            mode="lines",
-            line={"color": "lightgray"},
-            showlegend=False,
-        )
-    )
 
-    fig.update_layout(
-        title=f"Credit Saldo Movement, {min_date} to {max_date}",
-        xaxis_title="Date",
-        yaxis_title="Credit Saldo",
-        legend_title="Trx Types",
+def get_chart_trx(start_date: date | None = None, end_date: date | None = None):
+    """Return the trx to be charted (no initial load and nothing
+    before 2021), optionally limited to a date range.
+    """
+    trx = (
+        TrxCredit.objects.exclude(trx_type="Initial Load")
+        .filter(trx_date__year__gte="2021")
+        .order_by("trx_date", "id", "trx_type")
     )
+    if start_date:
+        trx = trx.filter(trx_date__gte=start_date)
+    if end_date:
+        trx = trx.filter(trx_date__lte=end_date)
+    return trx
+
+
+def get_trxcredit_series(trx) -> dict[str, list]:
+    """Fetch the chart columns of the (ordered) trx queryset in one
+    query and return them as a dict of equally long column lists.
+    """
+    return _columns(list(trx.values_list(*TRX_COLUMNS)))
+
+
+async def aget_trxcredit_series(trx) -> dict[str, list]:
+    """Async version of `get_trxcredit_series`."""
+    return _columns([row async for row in trx.values_list(*TRX_COLUMNS)])
+
+
+def _columns(rows: list[tuple]) -> dict[str, list]:
+    return {name: [row[i] for row in rows] for i, name in enumerate(TRX_COLUMNS)}
+
 
-    for trx_type in trx.order_by().values_list("trx_type", flat=True).distinct():
-        trx_subset = trx.filter(trx_type=trx_type)
-
-        # create custom_data array
-        trx_ids = [x.id for x in trx_subset]
-        record_ids = [str(x.record_id) for x in trx_subset]  # str to handle nulls
-        record_strings = [str(x.record_string) for x in trx_subset]  # str to handle nulls
-        trx_types = [x.trx_type for x in trx_subset]
-
-        fig.add_trace(
-            go.Scatter(
-                x=[x.trx_date for x in trx_subset],
-                y=[x.credit_saldo for x in trx_subset],
-                mode="markers",
-                marker={"color": color_dict[trx_type]},
-                name=trx_type,
-                customdata=list(zip(trx_ids, record_ids, record_strings, trx_types)),
-                hovertemplate="%{x}<br>"
-                + "Saldo: %{y}<br>"
-                + "Trx Id: %{customdata[0]}<br>"
-                + "Record Id: %{customdata[1]}<br>"
-                + "Record: %{customdata[2]}<br>"
-                + "<extra>%{customdata[3]}</extra>",
-            )
-        )
-
-    return fig.to_html()
+def serialize_trxcredit_series(series: dict[str, list]) -> dict:
+    """Return the columns in the compact format of the series api:
+    iso dates and the trx types as codes (indices into `types`).
+    """
+    types = list(dict.fromkeys(series["trx_type"]))
+    type_codes = {trx_type: code for code, trx_type in enumerate(types)}
+    return {
+        "types": types,
+        "id": series["id"],
+        "date": [d.isoformat() for d in series["trx_date"]],
+        "saldo": series["credit_saldo"],
+        "type": [type_codes[t] for t in series["trx_type"]],
+        "record_id": series["record_id"],
+        "record": series["record_string"],
+    }
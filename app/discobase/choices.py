@@ -1,10 +1,42 @@
-"""This is used for search_TEMP only. TODO may be deleted."""
+"""Choices of the SearchForm.
 
-from discobase.models import RecordFormat, Genre
+Genre and format choices are read from the db lazily, when a form is
+rendered or validated (and not on import), and then cached until a
+genre or format changes (see the signal receivers in `views.py`). The
+change is seen at once by processes sharing the default cache, by the
+others when their entry expires (see the TIMEOUT in settings.CACHES).
+"""
 
-genre_dict = {g.pk: g.genre_name for g in Genre.objects.all()}
-genre_choices = sorted(genre_dict.items(), key=lambda x: x[1], reverse=False)
-format_dict = {f.pk: f.format_name for f in RecordFormat.objects.all()}
-format_choices = sorted(format_dict.items(), key=lambda x: x[1], reverse=False)
-rating_dict = {"0": 0, "1": 1, "2": 2, "3": 3, "4": 4, "5": 5}
-rating_choices = sorted(rating_dict.items(), key=lambda x: x[1], reverse=False)
+from django.core.cache import cache
+
+from discobase.models import Genre, RecordFormat
+
+
+class ModelChoices:
+    """Callable returning (pk, name) choices of a model, sorted by name
+    and cached in the default cache (with its default timeout).
+    """
+
+    def __init__(self, model, name_field: str):
+        self.model = model
+        self.name_field = name_field
+        self.cache_key = f"choices:{model._meta.label_lower}"
+
+    def __call__(self) -> list[tuple[int, str]]:
+        choices = cache.get(self.cache_key)
+        if choices is None:
+            choices = list(
+                self.model.objects.order_by(self.name_field).values_list(
+                    "pk", self.name_field
+                )
+            )
+            cache.set(self.cache_key, choices)
+        return choices
+
+    def invalidate(self) -> None:
+        cache.delete(self.cache_key)
+
+
+genre_choices = ModelChoices(Genre, "genre_name")
+format_choices = ModelChoices(RecordFormat, "format_name")
+rating_choices = [(str(rating), rating) for rating in range(6)]
@@ -0,0 +1,211 @@
+"""Cover image pipeline.
+
+Cover images are downloaded in chunks to a temporary file instead of
+into memory, and decoded at reduced size where the format allows it
+(`Image.draft` lets the JPEG decoder scale down by up to 1/8 while
+decoding). The (capped) original is kept as `Record.cover_image`, from
+it a set of renditions is written to `covers/renditions/`, each fitting
+a square box and staying below a byte cap (the quality is lowered step
+by step, if necessary). They are stored in `Record.cover_renditions`,
+with their width (for the `srcset`, covers are not always square).
+
+Rendition filenames contain a hash of their content, so a file never
+changes once written. They are served by `CoverRenditionView` with an
+immutable far-future Cache-Control, and a changed cover gets new urls.
+Beside the renditions, `cover_renditions` holds a checksum of the cover
+(and the rendition settings), to skip unchanged covers when rebuilding
+them with `manage.py rebuild_covers`.
+"""
+
+import hashlib
+import math
+import re
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from PIL import Image, features
+
+# longest side of the kept original (if resized)
+MAX_ORIGINAL_SIZE = 1200
+MAX_DOWNLOAD_BYTES = 20 * 2**20
+CHUNK_SIZE = 64 * 2**10
+
+# name: (box size in px, max bytes), largest first
+RENDITIONS = {
+    "retina": (1200, 300_000),
+    "detail": (600, 100_000),
+    "thumb": (160, 15_000),
+}
+RENDITION_DIR = "covers/renditions"
+QUALITIES = (80, 70, 60, 50, 40)
+EXTENSIONS = {"WEBP": "webp", "AVIF": "avif"}
+CHECKSUM_KEY = "checksum"
+WIDTHS_KEY = "widths"
+HASHED_NAME_RE = re.compile(r"^[\w-]+\.[0-9a-f]{12}\.(webp|avif)$")
+
+
+def get_rendition_format() -> str:
+    """Return the configured rendition format (AVIF falls back to WebP,
+    if Pillow was built without AVIF support).
+    """
+    image_format = settings.COVER_RENDITION_FORMAT.upper()
+    if image_format == "AVIF" and not features.check("avif"):
+        return "WEBP"
+    return image_format
+
+
+def download_image(url: str, headers: dict | None = None) -> Path:
+    """Stream the image at the url into a temporary file and return
+    its path (to be deleted by the caller). Raise a ValueError, if the
+    image is larger than MAX_DOWNLOAD_BYTES.
+    """
+    with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        with tempfile.NamedTemporaryFile(suffix=".download", delete=False) as f:
+            path = Path(f.name)
+            size = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_DOWNLOAD_BYTES:
+                    f.close()
+                    path.unlink()
+                    raise ValueError(
+                        f"Image at {url} exceeds {MAX_DOWNLOAD_BYTES} bytes."
+                    )
+                f.write(chunk)
+    return path
+
+
+def open_reduced(source, size: int) -> Image.Image:
+    """Open and decode the image, at the smallest scale at which its
+    longest side still covers the passed size (for formats supporting
+    it, i.e. JPEG).
+    """
+    img = Image.open(source)
+    ratio = size / max(img.size)
+    if ratio < 1:
+        img.draft("RGB", (math.ceil(img.width * ratio), math.ceil(img.height * ratio)))
+    img.load()
+    return img
+
+
+def encode_capped(img: Image.Image, max_bytes: int) -> bytes:
+    """Encode the image in the rendition format, lowering the quality
+    until it fits into max_bytes (or the lowest quality is reached).
+    """
+    image_format = get_rendition_format()
+    for quality in QUALITIES:
+        buffer = BytesIO()
+        img.save(buffer, image_format, quality=quality)
+        if buffer.tell() <= max_bytes:
+            break
+    return buffer.getvalue()
+
+
+def is_rendition_name(name: str) -> bool:
+    """Return True for the (content hashed) name of a rendition file."""
+    return HASHED_NAME_RE.match(name) is not None
+
+
+def rendition_files(renditions: dict) -> set[str]:
+    """Return the filenames of the renditions in `cover_renditions`."""
+    return {filename for name, filename in renditions.items() if name in RENDITIONS}
+
+
+def cover_checksum(path) -> str:
+    """Return the sha256 of the cover file and the rendition settings
+    (so changing the latter invalidates all renditions).
+    """
+    checksum = hashlib.sha256(
+        repr((RENDITIONS, QUALITIES, get_rendition_format())).encode()
+    )
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def delete_renditions(filenames) -> None:
+    for filename in filenames:
+        (settings.MEDIA_ROOT / filename).unlink(missing_ok=True)
+
+
+def render_renditions(img: Image.Image, stem: str) -> dict:
+    """Write all renditions of the image and return their filenames
+    (relative to MEDIA_ROOT) by name, and their widths by name under
+    WIDTHS_KEY. The passed image may be shrunk in place.
+    """
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    extension = EXTENSIONS[get_rendition_format()]
+    (settings.MEDIA_ROOT / RENDITION_DIR).mkdir(parents=True, exist_ok=True)
+    renditions, widths = {}, {}
+    for name, (size, max_bytes) in RENDITIONS.items():
+        img.thumbnail((size, size))
+        content = encode_capped(img, max_bytes)
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        filename = f"{RENDITION_DIR}/{stem}_{name}.{digest}.{extension}"
+        path = settings.MEDIA_ROOT / filename
+        if not path.exists():
+            path.write_bytes(content)
+        renditions[name] = filename
+        widths[name] = img.width
+    renditions[WIDTHS_KEY] = widths
+    return renditions
+
+
+def save_cover(record, source, upload_dir: str, resize: bool) -> str:
+    """Save the image file `source` as cover of the record, limited to
+    MAX_ORIGINAL_SIZE if `resize` is set, and write its renditions. Set
+    `cover_image` and `cover_renditions` of the (unsaved) record (the
+    replaced renditions are deleted) and return the filename of the
+    cover. By definition cover images have a filename like {record_id}_0.
+    """
+    previous = rendition_files(record.cover_renditions)
+    img = open_reduced(source, MAX_ORIGINAL_SIZE) if resize else Image.open(source)
+    with img:
+        img_format = img.format  # only available for original image instance
+        if resize:
+            img.thumbnail((MAX_ORIGINAL_SIZE, MAX_ORIGINAL_SIZE))
+        filename = f"{upload_dir}/{record.pk}_0.{img_format.lower()}"
+        full_path = settings.MEDIA_ROOT / filename
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        img.save(full_path, img_format)
+        renditions = render_renditions(img, f"{record.pk}_0")
+    delete_renditions(previous - rendition_files(renditions))
+    renditions[CHECKSUM_KEY] = cover_checksum(full_path)
+    record.cover_renditions = renditions
+    record.cover_image = filename
+    return filename
+
+
+def rebuild_renditions(
+    record_pk: int, cover_name: str, renditions: dict, force: bool = False
+) -> tuple[int, str, dict]:
+    """Rebuild the renditions of a record from its cover, unless the
+    checksum is unchanged and all files exist (or `force` is set).
+    Return the record pk, the outcome ('rebuilt', 'unchanged' or
+    'missing') and the new `cover_renditions`. Runs in worker processes,
+    so it does not touch the database.
+    """
+    path = settings.MEDIA_ROOT / cover_name
+    if not path.is_file():
+        return record_pk, "missing", renditions
+    checksum = cover_checksum(path)
+    files = rendition_files(renditions)
+    if (
+        not force
+        and renditions.get(CHECKSUM_KEY) == checksum
+        and WIDTHS_KEY in renditions
+        and len(files) == len(RENDITIONS)
+        and all((settings.MEDIA_ROOT / filename).exists() for filename in files)
+    ):
+        return record_pk, "unchanged", renditions
+    with open_reduced(path, RENDITIONS["retina"][0]) as img:
+        new_renditions = render_renditions(img, f"{record_pk}_0")
+    delete_renditions(files - rendition_files(new_renditions))
+    new_renditions[CHECKSUM_KEY] = checksum
+    return record_pk, "rebuilt", new_renditions
@@ -6,41 +6,120 @@ discogs ID, or the ID of a record as argument to the function.
 If you pass none, the first record without discogs_id will be 
 chosen for addition.
 
-run from `app` directory with `python discobase/discogs.py [record.id | "list"]`
+Pass "batch" (and optionally the number of parallel workers) to
+process all records without valid discogs ID at once. Records with
+exactly one matching release are enriched automatically, ambiguous
+ones are written to a review queue to be resolved one by one.
+Pass "dry-run" instead of "batch" to only report the outcomes, without
+touching the database or the cover images.
+
+All GET responses of the api are kept in an on-disk cache (see
+`discogs_cache.py`), so re-runs only hit the network for new lookups.
+
+run from `app` directory with
+`python discobase/discogs.py [record.id | "list" | "batch" | "dry-run" [workers]]`
 
 TODO 1: Type hints for Raise and Returns are not properly declared.
 TODO 2: Maybe transform to a custom django_admin function.
 """
 
+import json
 import os
-import requests
 import sys
-from io import BytesIO
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import discogs_client
 import discogs_client.models
 import django
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
 from django.db.models import Q
 from django.core.exceptions import ObjectDoesNotExist
-from PIL import Image, UnidentifiedImageError
+from PIL import UnidentifiedImageError
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_disco.settings")
 django.setup()
 from django.conf import settings
+from discobase import covers
+from discobase.discogs_cache import CachingFetcher, DiscogsResponseCache
 from discobase.models import Record, Song
 
 
+class RateLimiter:
+    """Thread-safe sliding window rate limiter, allowing at most
+    `calls` calls within `period` seconds.
+    """
+
+    def __init__(self, calls: int, period: float = 60.0):
+        self.calls = calls
+        self.period = period
+        self._timestamps = deque()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Block until another call is allowed, then register it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._timestamps and now - self._timestamps[0] >= self.period:
+                    self._timestamps.popleft()
+                if len(self._timestamps) < self.calls:
+                    self._timestamps.append(now)
+                    return
+                delay = self.period - (now - self._timestamps[0])
+            time.sleep(delay)
+
+
+class ThrottledFetcher:
+    """Wrap the fetcher of a discogs client and wait for the rate
+    limiter before every request (shared by all worker threads).
+    Requests over the limit anyway (HTTP 429) are retried with
+    backoff by the discogs client itself.
+    """
+
+    def __init__(self, fetcher, limiter: RateLimiter):
+        self.fetcher = fetcher
+        self.limiter = limiter
+
+    def fetch(self, client, method, url, data=None, headers=None, json_format=True):
+        self.limiter.wait()
+        return self.fetcher.fetch(client, method, url, data, headers, json_format)
+
+    def __getattr__(self, name):
+        return getattr(self.fetcher, name)
+
+
+def get_response_cache() -> DiscogsResponseCache:
+    return DiscogsResponseCache(
+        settings.D_CACHE_PATH,
+        ttl=settings.D_CACHE_TTL_DAYS * 24 * 60 * 60,
+        max_bytes=settings.D_CACHE_MAX_MB * 2**20,
+    )
+
+
 def instantiate_discogs_client() -> discogs_client.client.Client:
-    """Return an authenticated discogs client instance."""
-    return discogs_client.Client(
+    """Return an authenticated discogs client instance, throttled
+    to the discogs rate limit. Cached responses are served before
+    the throttle, so they do not count against the limit.
+    """
+    client = discogs_client.Client(
         settings.D_USER_AGENT,
         consumer_key=settings.D_CONSUMER_KEY,
         consumer_secret=settings.D_CONSUMER_SECRET,
         token=settings.D_OAUTH_TOKEN,
         secret=settings.D_OAUTH_TOKEN_SECRET,
     )
+    client._base_url = settings.D_API_URL
+    client._fetcher = CachingFetcher(
+        ThrottledFetcher(
+            client._fetcher, RateLimiter(settings.D_RATE_LIMIT_PER_MINUTE)
+        ),
+        get_response_cache(),
+    )
+    return client
 
 
 def print_help_message() -> None:
@@ -50,19 +129,24 @@ def print_help_message() -> None:
         "to see all records with no valid discogs ID yet. Or (2) pass \n",
         "the ID of the record you want to add a discogs reference to. Or \n",
         "(3) pass no arg at all to return the first record without a \n",
-        "discogs reference.",
+        "discogs reference. Or (4) pass 'batch' (and optionally the number \n",
+        "of workers) to process all records without a discogs reference. \n",
+        "Pass 'dry-run' instead of 'batch' to only report the outcomes.",
     )
 
 
+def get_records_without_discogs_id():
+    """Return all records without a valid discogs ID."""
+    return Record.objects.filter(
+        Q(discogs_id__isnull=True) | Q(discogs_id__lt=100)
+    ).order_by("id")
+
+
 def print_record_list() -> None:
     """Print list of all records without a valid discogs ID. This
     function is called when the arg 'list' is passed.
     """
-    records = (
-        Record.objects.filter(Q(discogs_id__isnull=True) | Q(discogs_id__lt=100))
-        .order_by("id")
-        .all()
-    )
+    records = get_records_without_discogs_id().with_display_data()
     for record in records:
         print(f"- {str(record.id)} {record}")
 
@@ -79,11 +163,7 @@ def get_record(id: int | None) -> Record | None:
         except ObjectDoesNotExist:
             raise SystemExit(f"No record with Id {str(id)} found in discobase.")
     else:
-        record = (
-            Record.objects.filter(Q(discogs_id__isnull=True) | Q(discogs_id__lt=100))
-            .order_by("id")
-            .first()
-        )
+        record = get_records_without_discogs_id().first()
 
         if record is None:
             raise SystemExit("No record without discogs_id found in discobase.")
@@ -92,20 +172,32 @@ def get_record(id: int | None) -> Record | None:
     return record
 
 
-def list_discogs_releases(
+def find_discogs_releases(
     client: discogs_client.Client, record: Record
 ) -> list[discogs_client.models.Release]:
-    """Search matching discogs releases for the actual record
-    the print and return a list. Exit, if no releases are found.
+    """Search matching discogs releases (of the same format) for
+    the actual record and return them as a list.
     """
+    artist = record.artists.first()
+    if artist is None:
+        return []
     longlist = client.search(
         record.title,
         type="release",
-        artist=record.artists.first().artist_name,
+        artist=artist.artist_name,
         year=record.year,
     )
-    format_name = "Vinyl" if not record.record_format.id == 11 else "Cassette"
-    shortlist = [r for r in longlist if r.formats[0]["name"] == format_name]
+    format_name = "Vinyl" if not record.record_format_id == 11 else "Cassette"
+    return [r for r in longlist if r.formats[0]["name"] == format_name]
+
+
+def list_discogs_releases(
+    client: discogs_client.Client, record: Record
+) -> list[discogs_client.models.Release]:
+    """Search matching discogs releases for the actual record
+    the print and return a list. Exit, if no releases are found.
+    """
+    shortlist = find_discogs_releases(client, record)
     if len(shortlist) == 0:
         raise SystemExit(
             f"No release found on discogs for record with id {str(record.pk)}."
@@ -139,31 +231,25 @@ def save_cover_image(
     upload_dir: str,
     resize: bool,
 ) -> str | None:
-    """Fetch image from web, if necessary resize it to max height of 600
-    and save it to the correct folder. By definition cover images have
-    a filename like {record_id}_0.
+    """Download the image to a temporary file, save it (if necessary
+    limited to 1200 px) and its renditions to the correct folder, see
+    `covers.save_cover`. By definition cover images have a filename
+    like {record_id}_0.
     """
     try:
         url = release.images[0]["uri"]
-        request = requests.get(url, headers={"user-agent": f"{settings.D_USER_AGENT}"})
     except TypeError:
         print("ATTENTION - No image found for this record variant.")
         return None
 
+    path = covers.download_image(url, headers={"user-agent": settings.D_USER_AGENT})
     try:
-        with Image.open(BytesIO(request.content)) as img:
-            img_format = img.format  # only available for original image instance
-            if resize and img.height > 650:
-                img = img.resize((600, int(img.width / 600)))
-            filename = f"{upload_dir}/{record.pk}_0.{img_format.lower()}"
-            full_path = settings.MEDIA_ROOT / filename
-            full_path.absolute().parent.mkdir(parents=False, exist_ok=True)
-            img.save(full_path)
-            return filename
-
+        return covers.save_cover(record, path, upload_dir, resize)
     except UnidentifiedImageError:
         print("ATTENTION - Something went wrong while trying to read the image.")
         return None
+    finally:
+        path.unlink()
 
 
 def add_discogs_resources_to_db(
@@ -174,6 +260,8 @@ def add_discogs_resources_to_db(
     """
     record.discogs_id = release.id
     record.cover_image = filename
+    if not filename:
+        record.cover_renditions = {}
     record.save()
     if filename:
         print(f"Cover image and Discogs Id for release {release} added to DB.")
@@ -190,9 +278,113 @@ def add_discogs_resources_to_db(
         print("No songs added, they already exist in DB.")
 
 
+def auto_match_release(
+    releases: list[discogs_client.models.Release],
+) -> discogs_client.models.Release | None:
+    """Auto-match policy of the batch mode: a release is only chosen
+    without user input, if it is the only one matching the record.
+    """
+    return releases[0] if len(releases) == 1 else None
+
+
+def enrich_record(
+    client: discogs_client.Client,
+    record_id: int,
+    upload_dir: str,
+    resize: bool,
+    dry_run: bool = False,
+) -> tuple[str, list[int]]:
+    """Batch worker: search the releases for a record and, if one
+    can be auto-matched, add its resources to the record (unless it
+    is a dry run). Return the outcome ('matched', 'ambiguous',
+    'not_found' or 'failed') and the ids of the candidate releases.
+    """
+    try:
+        record = Record.objects.get(pk=record_id)
+        releases = find_discogs_releases(client, record)
+        release = auto_match_release(releases)
+        if release is None:
+            return ("ambiguous" if releases else "not_found"), [r.id for r in releases]
+        if dry_run:
+            return "matched", [release.id]
+        filename = save_cover_image(record, release, upload_dir, resize)
+        add_discogs_resources_to_db(record, release, filename)
+        return "matched", [release.id]
+    except Exception as e:
+        print(f"ATTENTION - Record {record_id} failed: {e!r}")
+        return "failed", []
+    finally:
+        # every worker thread has its own db connection
+        connection.close()
+
+
+def run_batch(
+    client: discogs_client.Client | None = None,
+    max_workers: int = 4,
+    upload_dir: str = "covers",
+    resize: bool = True,
+    queue_path=None,
+    dry_run: bool = False,
+) -> dict[int, tuple[str, list[int]]]:
+    """Process all records without valid discogs ID with a bounded pool
+    of worker threads (the discogs client is blocking, so the waiting
+    for the api is spread over the threads). All workers share the rate
+    limit of the client. Ambiguous records are written with their
+    candidate releases to the review queue (a json file). Return the
+    outcome per record id. A dry run neither writes to the database
+    nor saves cover images, and leaves the review queue as it is (the
+    ambiguous records are only printed).
+    """
+    client = client or instantiate_discogs_client()
+    queue_path = queue_path or settings.D_REVIEW_QUEUE_PATH
+    record_ids = list(get_records_without_discogs_id().values_list("id", flat=True))
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(enrich_record, client, id, upload_dir, resize, dry_run): id
+            for id in record_ids
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            record_id = futures[future]
+            results[record_id] = future.result()
+            outcome = results[record_id][0]
+            print(f"[{done}/{len(futures)}] Record {record_id}: {outcome}")
+
+    review_queue = [
+        {"record_id": record_id, "release_ids": release_ids}
+        for record_id, (outcome, release_ids) in sorted(results.items())
+        if outcome == "ambiguous"
+    ]
+    if dry_run:
+        for entry in review_queue:
+            print(f"Record {entry['record_id']} ambiguous: {entry['release_ids']}")
+        queue_info = "not queued, dry run"
+    else:
+        with open(queue_path, "w") as f:
+            json.dump(review_queue, f, indent=2)
+        queue_info = f"see {queue_path}"
+
+    outcomes = [outcome for outcome, _ in results.values()]
+    print(
+        f"{outcomes.count('matched')} matched, {outcomes.count('ambiguous')} "
+        f"ambiguous ({queue_info}), {outcomes.count('not_found')} not found, "
+        f"{outcomes.count('failed')} failed."
+    )
+    return results
+
+
 def main(arg: int | str | None, upload_dir: str = "covers", resize: bool = True):
     if arg == "list":
         print_record_list()
+    elif arg in ("batch", "dry-run"):
+        max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+        run_batch(
+            max_workers=max_workers,
+            upload_dir=upload_dir,
+            resize=resize,
+            dry_run=arg == "dry-run",
+        )
     elif isinstance(arg, int) or arg is None:
         client = instantiate_discogs_client()
         record = get_record(arg)
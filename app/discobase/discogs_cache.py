@@ -0,0 +1,138 @@
+"""Persistent on-disk cache for discogs api responses, used by
+`discogs.py`. Releases and search results hardly ever change, so
+re-runs of the script can be answered from a local SQLite file instead
+of spending the api rate limit (and seconds of latency) again.
+
+Responses are stored under the sha256 of method and url. Entries expire
+after `ttl` seconds, and the least recently used entries are evicted
+once the cache grows beyond `max_bytes`.
+"""
+
+import hashlib
+import sqlite3
+import time
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+
+class DiscogsResponseCache:
+    def __init__(
+        self, path, ttl: float = 30 * 24 * 60 * 60, max_bytes: int = 100 * 2**20
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    content BLOB NOT NULL,
+                    status_code INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection, commit (or roll back) and close it. A new
+        connection per call, so the cache can be shared by threads.
+        """
+        with closing(sqlite3.connect(self.path, timeout=30)) as db:
+            with db:
+                yield db
+
+    @staticmethod
+    def make_key(method: str, url: str) -> str:
+        return hashlib.sha256(f"{method} {url}".encode()).hexdigest()
+
+    def get(self, method: str, url: str) -> tuple[bytes, int] | None:
+        """Return content and status code of a cached response, or
+        None if there is no fresh one.
+        """
+        key = self.make_key(method, url)
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT content, status_code, created_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            content, status_code, created_at = row
+            if now - created_at > self.ttl:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return content, status_code
+
+    def set(self, method: str, url: str, content: bytes, status_code: int) -> None:
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.make_key(method, url),
+                    url,
+                    content,
+                    status_code,
+                    len(content),
+                    now,
+                    now,
+                ),
+            )
+            self._evict(db, now)
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        """Delete expired entries, then the least recently used ones
+        exceeding the size limit.
+        """
+        db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        db.execute(
+            """
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (
+                        ORDER BY accessed_at DESC, created_at DESC
+                    ) AS total_size
+                    FROM responses
+                ) WHERE total_size > ?
+            )
+            """,
+            (self.max_bytes,),
+        )
+
+    def clear(self) -> None:
+        with self._connect() as db:
+            db.execute("DELETE FROM responses")
+
+
+class CachingFetcher:
+    """Wrap the fetcher of a discogs client and answer GET requests
+    from the cache. Only successful responses are cached.
+    """
+
+    def __init__(self, fetcher, cache: DiscogsResponseCache):
+        self.fetcher = fetcher
+        self.cache = cache
+
+    def fetch(self, client, method, url, data=None, headers=None, json_format=True):
+        if method != "GET":
+            return self.fetcher.fetch(client, method, url, data, headers, json_format)
+        cached = self.cache.get(method, url)
+        if cached is not None:
+            return cached
+        content, status_code = self.fetcher.fetch(
+            client, method, url, data, headers, json_format
+        )
+        if 200 <= status_code < 300:
+            self.cache.set(method, url, content, status_code)
+        return content, status_code
+
+    def __getattr__(self, name):
+        return getattr(self.fetcher, name)
@@ -0,0 +1,117 @@
+"""Faceted filtering of the record list by the fields of the SearchForm.
+
+All filters are combined into one query. The text filters (artist and
+title) are matched against the search document first, which is backed
+by its GIN index (see `discobase.search`), and then narrowed down to
+their field.
+
+The facet counts (per genre, format and rating) are computed in a single
+aggregate query, with a filtered COUNT per facet value. Each facet is
+counted with all filters applied except its own, so the counts show how
+many records there are for every value of the facet.
+"""
+
+import re
+
+from django.db.models import Count, Exists, OuterRef, Q, QuerySet
+
+from discobase.models import Record
+from discobase.search import build_search_query
+
+# facet (SearchForm field): Record field
+FACETS = {"genre": "genre_id", "record_format": "record_format_id", "rating": "rating"}
+
+
+def _terms(text: str) -> list[str]:
+    return re.findall(r"\w+", text)
+
+
+def base_filter(cleaned_data: dict) -> Q:
+    """Return the condition of all filters that are not facets."""
+    condition = Q()
+    title = cleaned_data.get("title")
+    if title and build_search_query(title):
+        condition &= Q(search_vector=build_search_query(title))
+        for term in _terms(title):
+            condition &= Q(title__icontains=term)
+    artist = cleaned_data.get("artist")
+    if artist and build_search_query(artist):
+        condition &= Q(search_vector=build_search_query(artist))
+        for term in _terms(artist):
+            condition &= Q(
+                Exists(
+                    Record.artists.through.objects.filter(
+                        record=OuterRef("pk"), artist__artist_name__icontains=term
+                    )
+                )
+            )
+    if cleaned_data.get("min_purchase_date"):
+        condition &= Q(purchase_date__gte=cleaned_data["min_purchase_date"])
+    if cleaned_data.get("max_purchase_date"):
+        condition &= Q(purchase_date__lte=cleaned_data["max_purchase_date"])
+    return condition
+
+
+def facet_filters(cleaned_data: dict) -> dict[str, Q]:
+    """Return the condition of every facet with selected values."""
+    return {
+        facet: Q(**{f"{field}__in": [int(v) for v in cleaned_data[facet]]})
+        for facet, field in FACETS.items()
+        if cleaned_data.get(facet)
+    }
+
+
+def filter_records(queryset: QuerySet, cleaned_data: dict) -> QuerySet:
+    """Return the records of the queryset matching all filters."""
+    queryset = queryset.filter(base_filter(cleaned_data))
+    for condition in facet_filters(cleaned_data).values():
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def facet_counts(
+    queryset: QuerySet, cleaned_data: dict, facet_values: dict[str, list]
+) -> dict[str, dict]:
+    """Return the number of matching records per value of each facet,
+    e.g. {"genre": {1: 12, 2: 0}, ...}, for the passed values (usually
+    the choices of the form fields). All counts are computed in one
+    aggregate query over the queryset.
+    """
+    queryset, aggregates, keys = _facet_aggregates(queryset, cleaned_data, facet_values)
+    return _counts_by_facet(queryset.aggregate(**aggregates), keys, facet_values)
+
+
+async def afacet_counts(
+    queryset: QuerySet, cleaned_data: dict, facet_values: dict[str, list]
+) -> dict[str, dict]:
+    """Async version of `facet_counts`."""
+    queryset, aggregates, keys = _facet_aggregates(queryset, cleaned_data, facet_values)
+    return _counts_by_facet(await queryset.aaggregate(**aggregates), keys, facet_values)
+
+
+def _facet_aggregates(
+    queryset: QuerySet, cleaned_data: dict, facet_values: dict[str, list]
+) -> tuple[QuerySet, dict, dict]:
+    """Return the filtered queryset, the filtered COUNT per facet value
+    by alias and the (facet, value) of each alias.
+    """
+    queryset = queryset.filter(base_filter(cleaned_data))
+    filters = facet_filters(cleaned_data)
+    aggregates, keys = {}, {}
+    for facet, values in facet_values.items():
+        others = Q(*[condition for f, condition in filters.items() if f != facet])
+        for value in values:
+            alias = f"{facet}_{len(aggregates)}"
+            aggregates[alias] = Count(
+                "pk", filter=Q(**{FACETS[facet]: int(value)}) & others
+            )
+            keys[alias] = (facet, value)
+    return queryset.order_by(), aggregates, keys
+
+
+def _counts_by_facet(result: dict, keys: dict, facet_values: dict) -> dict[str, dict]:
+    counts = {facet: {} for facet in facet_values}
+    for alias, count in result.items():
+        facet, value = keys[alias]
+        counts[facet][value] = count
+    return counts
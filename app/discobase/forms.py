@@ -11,7 +11,7 @@ class DateForm(forms.Form):
 
 
 class SearchForm(forms.Form):
-    """Search records over multiple fields."""
+    """Search records over multiple fields (see `discobase.filters`)."""
 
     artist = forms.CharField(required=False)
     title = forms.CharField(required=False)
@@ -19,7 +19,9 @@ class SearchForm(forms.Form):
         choices=genre_choices, widget=forms.CheckboxSelectMultiple(), required=False
     )
     record_format = forms.MultipleChoiceField(
-        choices=format_choices, required=False, widget=forms.RadioSelect()
+        choices=format_choices,
+        required=False,
+        widget=forms.CheckboxSelectMultiple(),
     )
     min_purchase_date = forms.DateField(
         widget=forms.DateInput(attrs={"type": "date"}), required=False
@@ -27,4 +29,24 @@ class SearchForm(forms.Form):
     max_purchase_date = forms.DateField(
         widget=forms.DateInput(attrs={"type": "date"}), required=False
     )
-    rating = forms.MultipleChoiceField(choices=rating_choices, required=False)
+    rating = forms.MultipleChoiceField(
+        choices=rating_choices, widget=forms.CheckboxSelectMultiple(), required=False
+    )
+
+    facets = ("genre", "record_format", "rating")
+
+    def get_facet_values(self) -> dict[str, list]:
+        """Return the choice values of every facet field."""
+        return {
+            facet: [value for value, _ in self.fields[facet].choices]
+            for facet in self.facets
+        }
+
+    def set_facet_counts(self, counts: dict[str, dict]) -> None:
+        """Show the number of matching records beside every choice."""
+        for facet, facet_counts in counts.items():
+            field = self.fields[facet]
+            field.choices = [
+                (value, f"{label} ({facet_counts.get(value, 0)})")
+                for value, label in field.choices
+            ]
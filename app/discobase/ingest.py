@@ -0,0 +1,80 @@
+"""Batched ingest of new records, e.g. for imports.
+
+Saving records one by one sends post_save and m2m_changed signals for
+each of them, and their receivers (see `views.py`) append the purchase
+trx, patch its record string and rebuild the search document, each with
+queries of their own. `ingest_records` inserts the records, their artist
+and label links and their purchase trx with a few bulk inserts instead
+(bulk_create sends no signals) and rebuilds the search documents of all
+new records with one update. The number of queries does not depend on
+the number of records.
+"""
+
+from dataclasses import dataclass, field
+
+from django.db import router, transaction
+
+from discobase import ledger
+from discobase.models import Artist, Label, Record, TrxCredit
+from discobase.search import update_search_vectors
+
+
+@dataclass
+class RecordEntry:
+    """A new (unsaved) record with its (saved) artists and labels."""
+
+    record: Record
+    artists: list[Artist]
+    labels: list[Label] = field(default_factory=list)
+
+
+def purchase_trx(record: Record, record_string: str | None = None) -> TrxCredit:
+    """Return the (unsaved) purchase trx of a new record."""
+    return TrxCredit(
+        trx_date=record.purchase_date,
+        trx_type="Purchase",
+        trx_value=record.credit_value * -1,
+        record=record,
+        record_string=record_string,
+    )
+
+
+def ingest_records(entries: list[RecordEntry], batch_size: int = 1000) -> list[Record]:
+    """Insert the records of the entries with their artists and labels
+    and append their purchase trx to the ledger (in the passed order),
+    all in one transaction. Return the saved records.
+    """
+    using = router.db_for_write(Record)
+    max_length = TrxCredit._meta.get_field("record_string").max_length
+    with transaction.atomic(using=using):
+        records = Record.objects.using(using).bulk_create(
+            [entry.record for entry in entries], batch_size=batch_size
+        )
+        artist_links, label_links, trxs = [], [], []
+        for entry in entries:
+            # without duplicates, in the passed order (the insertion order
+            # is the order of the names, see `models.joined_names`)
+            artists = list(dict.fromkeys(entry.artists))
+            labels = list(dict.fromkeys(entry.labels))
+            artist_links += [
+                Record.artists.through(record=entry.record, artist=artist)
+                for artist in artists
+            ]
+            label_links += [
+                Record.labels.through(record=entry.record, label=label)
+                for label in labels
+            ]
+            # set the display strings, as `with_display_data` would
+            entry.record.artists_str = " / ".join(a.artist_name for a in artists)
+            entry.record.labels_str = " / ".join(label.label_name for label in labels)
+            trxs.append(purchase_trx(entry.record, str(entry.record)[:max_length]))
+
+        Record.artists.through.objects.using(using).bulk_create(
+            artist_links, batch_size=batch_size
+        )
+        Record.labels.through.objects.using(using).bulk_create(
+            label_links, batch_size=batch_size
+        )
+        ledger.append_trxs(trxs)
+        update_search_vectors([record.pk for record in records])
+    return records
@@ -0,0 +1,202 @@
+"""Per-request instrumentation: number of queries, db time, view time
+and template render time of every request, by url name.
+
+The timings are logged to the logger of this module and, with the
+INSTRUMENTATION_SERVER_TIMING setting (default: DEBUG), sent to the
+browser as Server-Timing header (shown in the network tab of the dev
+tools). The last `INSTRUMENTATION_SAMPLES` requests per url name are
+kept in memory, their summary is served by the `RequestStatsView`.
+NOTE: The stats are per process (and reset on restart).
+
+Queries are counted with an execute wrapper on every db connection, so
+this works with DEBUG off (unlike `connection.queries`). Template time
+is the rendering of TemplateResponses (i.e. of the generic views),
+views rendering their templates themselves include it in the view time.
+Queries of streaming responses run after the middleware returned and
+are not counted.
+"""
+
+import logging
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+UNRESOLVED = "<unresolved>"
+
+
+class RequestMetrics:
+    """Timings (in ms) and number of queries of a request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.view = 0.0
+        self.template = 0.0
+        self.total = 0.0
+        self.view_start = None
+        self.render_start = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper counting the queries and their time."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += (time.perf_counter() - start) * 1000
+            self.queries += 1
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            [
+                f'db;dur={self.db:.1f};desc="{self.queries} queries"',
+                f"view;dur={self.view:.1f}",
+                f"template;dur={self.template:.1f}",
+                f"total;dur={self.total:.1f}",
+            ]
+        )
+
+
+class RequestStats:
+    """Rolling window of the metrics of the last requests per url name."""
+
+    def __init__(self, samples: int):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._metrics = defaultdict(lambda: deque(maxlen=self.samples))
+
+    def add(self, url_name: str, metrics: RequestMetrics) -> None:
+        with self._lock:
+            self._metrics[url_name].append(
+                (
+                    metrics.total,
+                    metrics.view,
+                    metrics.template,
+                    metrics.db,
+                    metrics.queries,
+                )
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._metrics.clear()
+
+    def summary(self) -> dict[str, dict]:
+        """Return the number of requests, p50 / p95 / max total time and
+        the mean view, template and db time and queries per url name.
+        """
+        with self._lock:
+            metrics = {name: list(values) for name, values in self._metrics.items()}
+        summary = {}
+        for name, values in sorted(metrics.items()):
+            total, view, template, db, queries = zip(*values)
+            summary[name] = {
+                "requests": len(values),
+                "total_p50": statistics.median(total),
+                "total_p95": _percentile(total, 95),
+                "total_max": max(total),
+                "view_mean": statistics.fmean(view),
+                "template_mean": statistics.fmean(template),
+                "db_mean": statistics.fmean(db),
+                "queries_mean": statistics.fmean(queries),
+                "queries_max": max(queries),
+            }
+        return summary
+
+
+def _percentile(values, percent: int) -> float:
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+request_stats = RequestStats(getattr(settings, "INSTRUMENTATION_SAMPLES", 1000))
+
+
+def _wrap_connections(stack: ExitStack, metrics: RequestMetrics) -> None:
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(metrics))
+
+
+class InstrumentationMiddleware:
+    """Measure every request (see above). Put it first, so that the
+    total time includes the other middleware. Works sync and async.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = request._metrics = RequestMetrics()
+        with ExitStack() as stack:
+            _wrap_connections(stack, metrics)
+            response = self.get_response(request)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        # the connections are thread-local, the (async) ORM uses the
+        # ones of the thread its sync parts run in
+        metrics = request._metrics = RequestMetrics()
+        stack = ExitStack()
+        await sync_to_async(_wrap_connections)(stack, metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response)
+
+    def finish(self, request, response):
+        """Complete the metrics, store, log and (if enabled) send them."""
+        metrics = request._metrics
+        end = time.perf_counter()
+        metrics.total = (end - metrics.start) * 1000
+        if metrics.view_start is not None and metrics.render_start is None:
+            metrics.view = (end - metrics.view_start) * 1000
+
+        match = getattr(request, "resolver_match", None)
+        url_name = match.view_name if match and match.url_name else UNRESOLVED
+        request_stats.add(url_name, metrics)
+        if getattr(settings, "INSTRUMENTATION_SERVER_TIMING", False):
+            response["Server-Timing"] = metrics.server_timing()
+        logger.info(
+            "%s %s: %.1f ms (view %.1f ms, template %.1f ms, db %.1f ms, %d queries)",
+            url_name,
+            response.status_code,
+            metrics.total,
+            metrics.view,
+            metrics.template,
+            metrics.db,
+            metrics.queries,
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        metrics = request._metrics
+        metrics.render_start = time.perf_counter()
+        if metrics.view_start is not None:
+            metrics.view = (metrics.render_start - metrics.view_start) * 1000
+
+        def render_finished(response):
+            metrics.template = (time.perf_counter() - metrics.render_start) * 1000
+
+        response.add_post_render_callback(render_finished)
+        return response
@@ -0,0 +1,161 @@
+"""The credit ledger (TrxCredit) is an append-only list of transactions,
+each carrying the running credit saldo after it.
+
+All appends go through this module. They hold a transaction-scoped
+advisory lock while reading the last saldo and inserting, so concurrent
+requests cannot interleave and compute their saldo from the same row.
+"""
+
+from datetime import date, timedelta
+
+from django.db import connections, router, transaction
+
+from discobase.chart_cache import bump_ledger_version
+from discobase.models import TrxCredit
+
+# arbitrary, but fixed key of the advisory lock guarding the ledger
+LEDGER_LOCK_ID = 7_010_521
+
+RECOMPUTE_SALDO_SQL = """
+UPDATE {table} AS trx
+SET credit_saldo = running.saldo, updated_at = now()
+FROM (
+    SELECT id, SUM(trx_value) OVER (ORDER BY id) AS saldo
+    FROM {table}
+) AS running
+WHERE trx.id = running.id
+AND trx.credit_saldo IS DISTINCT FROM running.saldo
+"""
+
+SALDO_DEVIATIONS_SQL = """
+SELECT id, trx_type, credit_saldo, saldo
+FROM (
+    SELECT id, trx_type, credit_saldo, SUM(trx_value) OVER (ORDER BY id) AS saldo
+    FROM {table}
+) AS running
+WHERE credit_saldo IS DISTINCT FROM saldo
+ORDER BY id
+"""
+
+
+class LedgerError(Exception):
+    pass
+
+
+def _lock_ledger(using: str) -> None:
+    """Take the ledger lock until the end of the current transaction."""
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [LEDGER_LOCK_ID])
+
+
+def get_last_saldo(using: str | None = None) -> int:
+    """Return the credit saldo after the last trx (0 for an empty ledger)."""
+    using = using or router.db_for_write(TrxCredit)
+    last_saldo = (
+        TrxCredit.objects.using(using)
+        .order_by("-id")
+        .values_list("credit_saldo", flat=True)
+        .first()
+    )
+    return last_saldo or 0
+
+
+def append_trxs(trxs: list[TrxCredit]) -> list[TrxCredit]:
+    """Append the passed (unsaved) trx to the ledger, in the passed
+    order. Their running saldo is computed from the last saldo and
+    all of them are inserted with one bulk insert.
+    """
+    using = router.db_for_write(TrxCredit)
+    with transaction.atomic(using=using):
+        _lock_ledger(using)
+        credit_saldo = get_last_saldo(using)
+        for trx in trxs:
+            credit_saldo += trx.trx_value
+            trx.credit_saldo = credit_saldo
+        # bulk_create sends no signals, so invalidate the cached charts here
+        transaction.on_commit(bump_ledger_version, using=using)
+        return TrxCredit.objects.using(using).bulk_create(trxs)
+
+
+def append_trx(trx_date, trx_type: str, trx_value: int, **kwargs) -> TrxCredit:
+    """Append a single trx to the ledger, see `append_trxs`. Optional
+    kwargs are `record` and `record_string`.
+    """
+    trx = TrxCredit(trx_date=trx_date, trx_type=trx_type, trx_value=trx_value, **kwargs)
+    return append_trxs([trx])[0]
+
+
+def create_addition_credits(
+    interval_days: int = 14, today: date | None = None
+) -> list[TrxCredit]:
+    """Every x days a new credit is added (to be spent on
+    purchasing new records). This function computes all
+    additions due since the last one (the very first addition
+    is due today) and appends them in one batch. Calling it
+    again on the same day adds nothing. Return the new trx.
+    """
+    today = today or date.today()
+    interval = timedelta(days=interval_days)
+    using = router.db_for_write(TrxCredit)
+    with transaction.atomic(using=using):
+        _lock_ledger(using)
+        last_addition_date = (
+            TrxCredit.objects.using(using)
+            .filter(trx_type="Addition")
+            .order_by("-id")
+            .values_list("trx_date", flat=True)
+            .first()
+        )
+        if last_addition_date is None:
+            last_addition_date = today - interval
+
+        due = (today - last_addition_date).days // interval_days
+        additions = [
+            TrxCredit(
+                trx_date=last_addition_date + interval * i,
+                trx_type="Addition",
+                trx_value=1,
+                record=None,
+                record_string=None,
+            )
+            for i in range(1, due + 1)
+        ]
+        return append_trxs(additions) if additions else []
+
+
+def find_saldo_deviations(using: str | None = None) -> list[tuple]:
+    """Return id, type, saldo and recomputed saldo (the sum of all trx
+    values up to and including it, ordered by id) of all trx whose saldo
+    deviates from the recomputed one.
+    """
+    using = using or router.db_for_write(TrxCredit)
+    with connections[using].cursor() as cursor:
+        cursor.execute(SALDO_DEVIATIONS_SQL.format(table=TrxCredit._meta.db_table))
+        return cursor.fetchall()
+
+
+def recompute_saldo(dry_run: bool = False) -> list[tuple]:
+    """Rebuild the running saldo of all trx in one pass (see
+    `find_saldo_deviations`). Only rows with a deviating saldo are
+    written, they are returned. With `dry_run` nothing is written.
+    The recomputation assumes the 'Initial Load' trx carry their saldo
+    as value (i.e. they start the ledger). If one of them deviates, a
+    LedgerError is raised and nothing is written.
+    """
+    using = router.db_for_write(TrxCredit)
+    with transaction.atomic(using=using):
+        _lock_ledger(using)
+        deviations = find_saldo_deviations(using)
+        initial_loads = [row[0] for row in deviations if row[1] == "Initial Load"]
+        if initial_loads:
+            raise LedgerError(
+                "The saldo of the 'Initial Load' trx "
+                f"{', '.join(map(str, initial_loads))} is not their running sum."
+            )
+        if deviations and not dry_run:
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    RECOMPUTE_SALDO_SQL.format(table=TrxCredit._meta.db_table)
+                )
+            transaction.on_commit(bump_ledger_version, using=using)
+    return deviations
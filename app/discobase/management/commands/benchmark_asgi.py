@@ -0,0 +1,192 @@
+import asyncio
+import random
+import statistics
+import threading
+import time
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from discobase.models import Record
+
+# not an INTERNAL_IP, to keep the debug toolbar out of the measurements
+CLIENT_ADDR = "192.0.2.1"
+
+
+def request_paths(record_ids: list[int], async_views: bool) -> list:
+    """Return functions returning the path (and query string) of the next
+    request to the record list, a record detail and the chart data.
+    """
+    suffix = "_async" if async_views else ""
+    list_path = reverse(f"discobase:record_list{suffix}")
+    series_path = reverse(f"discobase:trxcredit_series{suffix}")
+    return [
+        lambda: (list_path, ""),
+        lambda: (
+            reverse(
+                f"discobase:record_detail{suffix}", args=[random.choice(record_ids)]
+            ),
+            "order=purchase_date",
+        ),
+        lambda: (series_path, "start_date=2022-01-01"),
+    ]
+
+
+def wsgi_get(application, path: str, query_string: str) -> int:
+    """Pass a GET request to the WSGI application, return the status."""
+    environ = {
+        "PATH_INFO": path,
+        "QUERY_STRING": query_string,
+        "REMOTE_ADDR": CLIENT_ADDR,
+        "wsgi.input": BytesIO(),
+    }
+    setup_testing_defaults(environ)
+    status = []
+    result = application(environ, lambda s, headers, exc_info=None: status.append(s))
+    try:
+        b"".join(result)
+    finally:
+        # sends request_finished, which closes the connections (if obsolete)
+        result.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_get(application, path: str, query_string: str) -> int:
+    """Pass a GET request to the ASGI application, return the status."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"testserver")],
+        "client": (CLIENT_ADDR, 50000),
+        "server": ("testserver", 80),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]["status"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the record list, record detail and chart "
+        "data requests with concurrent clients: the sync views through the "
+        "WSGI handler (of wsgi.py) and the async (and sync) views through the "
+        "ASGI handler (of asgi.py). Reads the data of the database as is."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+        parser.add_argument("--requests", type=int, default=300)
+
+    def handle(self, *args, **options):
+        # every client makes requests // concurrency requests, and the
+        # p95 needs at least two latencies
+        if options["requests"] < max(2, *options["concurrency"]):
+            raise CommandError(
+                "--requests must be at least 2 and the highest --concurrency."
+            )
+        record_ids = list(Record.objects.values_list("id", flat=True))
+        if not record_ids:
+            raise CommandError("No records, add some with seed_synthetic.")
+        connections.close_all()
+        random.seed(0)
+
+        profiles = {
+            "wsgi, sync views": (self.run_wsgi, False),
+            "asgi, async views": (self.run_asgi, True),
+            "asgi, sync views": (self.run_asgi, False),
+        }
+        with override_settings(ALLOWED_HOSTS=["*"]):
+            for concurrency in options["concurrency"]:
+                self.stdout.write(f"{concurrency} concurrent clients:")
+                for name, (run, async_views) in profiles.items():
+                    paths = request_paths(record_ids, async_views)
+                    start = time.perf_counter()
+                    latencies = run(paths, concurrency, options["requests"])
+                    duration = time.perf_counter() - start
+                    self.stdout.write(
+                        f"- {name}: {len(latencies) / duration:.0f} requests/s, "
+                        f"p50 {statistics.median(latencies):.1f} ms, "
+                        f"p95 {statistics.quantiles(latencies, n=20)[18]:.1f} ms"
+                    )
+
+    def run_wsgi(self, paths: list, concurrency: int, requests: int) -> list[float]:
+        """Run the requests with a thread per client (like a threaded WSGI
+        server), return the latencies (ms).
+        """
+        application = WSGIHandler()
+        latencies, errors = [], []
+
+        def client(count):
+            try:
+                for i in range(count):
+                    start = time.perf_counter()
+                    status = wsgi_get(application, *paths[i % len(paths)]())
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    if status != 200:
+                        errors.append(status)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=client, args=(requests // concurrency,))
+            for _ in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise CommandError(f"Requests failed with status {errors[0]}.")
+        return latencies
+
+    def run_asgi(self, paths: list, concurrency: int, requests: int) -> list[float]:
+        """Run the requests with a task per client in one event loop (like
+        an ASGI server), return the latencies (ms). Connections are not
+        reused, as with the asgi server profile (see settings).
+        """
+        application = ASGIHandler()
+        latencies = []
+
+        async def client(count):
+            for i in range(count):
+                start = time.perf_counter()
+                status = await asgi_get(application, *paths[i % len(paths)]())
+                latencies.append((time.perf_counter() - start) * 1000)
+                if status != 200:
+                    raise CommandError(f"Requests failed with status {status}.")
+
+        async def clients():
+            await asyncio.gather(
+                *[client(requests // concurrency) for _ in range(concurrency)]
+            )
+
+        settings_dicts = [connections.settings[alias] for alias in connections]
+        max_ages = [settings_dict["CONN_MAX_AGE"] for settings_dict in settings_dicts]
+        try:
+            for settings_dict in settings_dicts:
+                settings_dict["CONN_MAX_AGE"] = 0
+            asyncio.run(clients())
+        finally:
+            for settings_dict, max_age in zip(settings_dicts, max_ages):
+                settings_dict["CONN_MAX_AGE"] = max_age
+        return latencies
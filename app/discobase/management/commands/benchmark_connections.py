@@ -0,0 +1,86 @@
+import importlib.util
+import statistics
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+# connection settings by name (None if not supported here)
+MODES = {
+    "new connection per request": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False},
+    "persistent": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": False},
+    "persistent, health checks": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True},
+    "pool": (
+        {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "OPTIONS": {"pool": True}}
+        if django.VERSION >= (5, 1) and importlib.util.find_spec("psycopg_pool")
+        else None
+    ),
+}
+
+URL_NAMES = ["discobase:record_list", "discobase:trxcredit_list"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the latency of (read-only) requests with a new db connection "
+        "per request, persistent connections (with and without health checks) "
+        "and a connection pool (Django 5.1+ with psycopg 3 only)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options["requests"] < 2:
+            raise CommandError("--requests must be at least 2 (for the p95).")
+        # not an INTERNAL_IP, to keep the debug toolbar out of the measurements
+        client = Client(REMOTE_ADDR="192.0.2.1")
+        connection = connections["default"]
+        original = connection.settings_dict.copy()
+        try:
+            with override_settings(ALLOWED_HOSTS=["*"]):
+                for name, mode in MODES.items():
+                    if mode is None:
+                        self.stdout.write(
+                            f"- {name}: skipped (needs Django 5.1+ with psycopg 3)"
+                        )
+                        continue
+                    connection.close()
+                    connection.settings_dict.update(
+                        mode, OPTIONS={**original["OPTIONS"], **mode.get("OPTIONS", {})}
+                    )
+                    latencies = self.measure(client, options["requests"])
+                    self.stdout.write(
+                        f"- {name}: p50 {statistics.median(latencies):.2f} ms, "
+                        f"p95 {statistics.quantiles(latencies, n=20)[18]:.2f} ms"
+                    )
+        finally:
+            connection.close()
+            if hasattr(connection, "close_pool"):
+                connection.close_pool()
+            connection.settings_dict.clear()
+            connection.settings_dict.update(original)
+
+    def measure(self, client: Client, requests: int) -> list[float]:
+        """Request the views in turn, return the latencies (ms). The
+        connections are closed (or kept) at the end of every request,
+        as by the request handler (the test client does not do that).
+        """
+        urls = [reverse(url_name) for url_name in URL_NAMES]
+        client.get(urls[0])  # warm up
+        close_old_connections()
+        latencies = []
+        for i in range(requests):
+            start = time.perf_counter()
+            response = client.get(urls[i % len(urls)])
+            close_old_connections()
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"{urls[i % len(urls)]} returned {response.status_code}."
+                )
+        return latencies
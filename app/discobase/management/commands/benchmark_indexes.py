@@ -0,0 +1,85 @@
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from discobase import synthetic
+from discobase.charts import TRX_COLUMNS, get_chart_trx
+from discobase.models import Record, TrxCredit
+
+# the indexes of migration 0024 (without the ones dropped by 0026)
+INDEXES = [
+    "record_purchase_date_id_idx",
+    "record_without_discogs_idx",
+    "trxcredit_type_id_idx",
+    "trxcredit_date_id_idx",
+]
+
+
+def hot_queries() -> dict:
+    """The queries the indexes are made for, by name."""
+    return {
+        "record list page": Record.objects.order_by("-purchase_date", "-id")[:51],
+        "records without discogs id": Record.objects.filter(
+            Q(discogs_id__isnull=True) | Q(discogs_id__lt=100)
+        ).order_by("id"),
+        "last addition trx": TrxCredit.objects.filter(trx_type="Addition").order_by(
+            "-id"
+        )[:1],
+        "last removal trx": TrxCredit.objects.filter(trx_type="Removal").order_by(
+            "-id"
+        )[:1],
+        "chart date range": get_chart_trx(
+            date(2022, 1, 1), date(2022, 3, 31)
+        ).values_list(*TRX_COLUMNS),
+    }
+
+
+def explain(queryset) -> tuple[float, list[str]]:
+    """Return execution time (ms) and used indexes of the query."""
+    plan = json.loads(queryset.explain(format="json", analyze=True))[0]
+    indexes, nodes = [], [plan["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if "Index Name" in node:
+            indexes.append(node["Index Name"])
+        nodes.extend(node.get("Plans", []))
+    return plan["Execution Time"], indexes
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the query plans of the hot queries with and without the "
+        "indexes of migration 0024, on synthetic data that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=200_000)
+        parser.add_argument("--trx", type=int, default=1_000_000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            synthetic.seed(options["records"], options["trx"])
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            queries = hot_queries()
+            with_indexes = {n: explain(q) for n, q in queries.items()}
+            with connection.cursor() as cursor:
+                for index in INDEXES:
+                    cursor.execute(f"DROP INDEX {index}")
+                cursor.execute("ANALYZE")
+            without_indexes = {n: explain(q) for n, q in queries.items()}
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"{options['records']} records, {options['trx']} further trx "
+            "(execution time without -> with indexes):"
+        )
+        for name, (time, indexes) in with_indexes.items():
+            time_without, _ = without_indexes[name]
+            self.stdout.write(
+                f"- {name}: {time_without:.2f} ms -> {time:.2f} ms "
+                f"(using {', '.join(indexes) or 'no index'})"
+            )
@@ -0,0 +1,139 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from discobase import choices, synthetic
+from discobase.chart_cache import bump_ledger_version
+from discobase.models import Genre, Record
+
+
+def view_requests(record_ids: list[int]) -> dict:
+    """Return the benchmarked views by name, each as a function
+    returning the url (and query params) of the next request.
+    """
+    genre = Genre.objects.order_by("id").values_list("id", flat=True).first()
+    list_url = reverse("discobase:record_list")
+    return {
+        "record list": lambda: (list_url, {}),
+        "record list, last page": lambda: (list_url, {"cursor": "last"}),
+        "record list, search": lambda: (
+            list_url,
+            {"q": random.choice(["grave", "mor"])},
+        ),
+        "record list, filtered": lambda: (list_url, {"genre": genre, "rating": 5}),
+        "record detail": lambda: (
+            reverse("discobase:record_detail", args=[random.choice(record_ids)]),
+            {"order": "purchase_date"},
+        ),
+        "trx list": lambda: (reverse("discobase:trxcredit_list"), {}),
+        "trx chart": lambda: (reverse("discobase:trxcredit_chart"), {}),
+        "trx series api": lambda: (reverse("discobase:trxcredit_series"), {}),
+    }
+
+
+def measure(client: Client, next_request, requests: int) -> dict:
+    """Request the view repeatedly, return p50 and p95 latency (ms)
+    and the (maximal) number of queries.
+    """
+    latencies, queries = [], []
+    for _ in range(requests):
+        url, params = next_request()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = client.get(url, params)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}.")
+        queries.append(len(context))
+    return {
+        "p50": statistics.median(latencies),
+        "p95": statistics.quantiles(latencies, n=20, method="inclusive")[18],
+        "queries": max(queries),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure p50/p95 latency and query count of the main views on "
+        "synthetic collections of the passed sizes (rolled back at the end). "
+        "Optionally save the results or compare them to saved ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", type=int, nargs="+", default=[1_000, 10_000])
+        parser.add_argument("--requests", type=int, default=20)
+        parser.add_argument("--output", help="Save the results as json.")
+        parser.add_argument("--compare", help="Compare with saved results.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=1.25,
+            help="Report a p95 above threshold * baseline as regression.",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 2:
+            raise CommandError("--requests must be at least 2 (for the p95).")
+        random.seed(0)
+        baseline = {}
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+
+        # not an INTERNAL_IP, to keep the debug toolbar out of the measurements
+        client = Client(REMOTE_ADDR="192.0.2.1")
+        results = {}
+        with override_settings(ALLOWED_HOSTS=["*"]):
+            for scale in options["scales"]:
+                results[str(scale)] = self.run_scale(client, scale, options["requests"])
+
+        for scale, views in results.items():
+            self.stdout.write(f"{scale} records:")
+            for name, result in views.items():
+                line = (
+                    f"- {name}: p50 {result['p50']:.1f} ms, p95 {result['p95']:.1f} ms, "
+                    f"{result['queries']} queries"
+                )
+                previous = baseline.get(scale, {}).get(name)
+                if previous:
+                    line += f" (baseline p95 {previous['p95']:.1f} ms"
+                    if result["p95"] > previous["p95"] * options["threshold"]:
+                        line += ", REGRESSION"
+                    if result["queries"] > previous["queries"]:
+                        line += f", {previous['queries']} queries before"
+                    line += ")"
+                self.stdout.write(line)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def run_scale(self, client: Client, scale: int, requests: int) -> dict:
+        with transaction.atomic():
+            synthetic.seed(records=scale, trx=0, search_vectors=True)
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            self.reset_caches()
+            record_ids = list(Record.objects.values_list("id", flat=True))
+            results = {
+                name: measure(client, next_request, requests)
+                for name, next_request in view_requests(record_ids).items()
+            }
+            transaction.set_rollback(True)
+        # the synthetic rows are gone, so are genres and trx
+        self.reset_caches()
+        return results
+
+    def reset_caches(self) -> None:
+        bump_ledger_version()
+        choices.genre_choices.invalidate()
+        choices.format_choices.invalidate()
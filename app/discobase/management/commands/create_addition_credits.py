@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from discobase import ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Add the credits due since the last addition trx. Meant to be "
+        "scheduled (e.g. daily with cron), it adds nothing if run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval-days", type=int, default=14)
+
+    def handle(self, *args, **options):
+        additions = ledger.create_addition_credits(options["interval_days"])
+        self.stdout.write(f"{len(additions)} addition trx created.")
@@ -0,0 +1,64 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from discobase import covers
+from discobase.models import Record
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the renditions of all cover images in parallel processes. "
+        "Covers with unchanged checksum are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument(
+            "--force", action="store_true", help="Rebuild unchanged covers too."
+        )
+
+    def handle(self, *args, **options):
+        placeholder = Record._meta.get_field("cover_image").default
+        records = (
+            Record.objects.exclude(cover_image__in=["", placeholder])
+            .exclude(cover_image__isnull=True)
+            .order_by("id")
+            .values_list("id", "cover_image", "cover_renditions")
+        )
+        start = time.perf_counter()
+        outcomes = Counter()
+        # decoding and encoding is cpu bound, the workers only return the
+        # new renditions, which are saved to the db in this process
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = {
+                executor.submit(
+                    covers.rebuild_renditions, id, name, renditions, options["force"]
+                ): id
+                for id, name, renditions in records
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                record_id = futures[future]
+                try:
+                    _, outcome, renditions = future.result()
+                except Exception as e:
+                    outcome = "failed"
+                    self.stderr.write(f"Record {record_id} failed: {e!r}")
+                if outcome == "rebuilt":
+                    Record.objects.filter(pk=record_id).update(
+                        cover_renditions=renditions
+                    )
+                outcomes[outcome] += 1
+                self.stdout.write(
+                    f"[{done}/{len(futures)}] Record {record_id}: {outcome}"
+                )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{outcomes['rebuilt']} rebuilt, {outcomes['unchanged']} unchanged, "
+            f"{outcomes['missing']} missing, {outcomes['failed']} failed "
+            f"in {elapsed:.1f}s ({len(futures) / elapsed if elapsed else 0:.1f} covers/s)."
+        )
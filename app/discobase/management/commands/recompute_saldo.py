@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from discobase import ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuild the running credit saldo of all trx in one pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the trx with a deviating saldo.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            deviations = ledger.recompute_saldo(dry_run=options["dry_run"])
+        except ledger.LedgerError as e:
+            raise CommandError(str(e))
+        for trx_id, trx_type, saldo, recomputed in deviations:
+            self.stdout.write(f"- trx {trx_id} ({trx_type}): {saldo} -> {recomputed}")
+        if options["dry_run"]:
+            self.stdout.write(f"Credit saldo deviates for {len(deviations)} trx.")
+        else:
+            self.stdout.write(f"Credit saldo corrected for {len(deviations)} trx.")
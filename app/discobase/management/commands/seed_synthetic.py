@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from discobase import synthetic
+from discobase.chart_cache import bump_ledger_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert a synthetic record collection and its credit ledger "
+        "(for benchmarks, never run it on the production database)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=10_000)
+        parser.add_argument(
+            "--trx", type=int, default=0, help="Trx on top of the purchases."
+        )
+        parser.add_argument(
+            "--skip-search-vectors",
+            action="store_true",
+            help="Don't build the search documents of the new records.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic():
+            counts = synthetic.seed(
+                options["records"],
+                options["trx"],
+                search_vectors=not options["skip_search_vectors"],
+            )
+            # the rows are inserted with plain sql, so no signals are sent
+            transaction.on_commit(bump_ledger_version)
+        self.stdout.write(
+            ", ".join(f"{count} {table}" for table, count in counts.items())
+            + f" rows inserted in {time.perf_counter() - start:.1f}s."
+        )
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.3 on 2026-10-17 10:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Same document as `discobase.search.search_document`, for the existing records
+BACKFILL_SEARCH_VECTOR = """
+UPDATE discobase_record r SET search_vector =
+    setweight(to_tsvector('simple', coalesce(r.title, '')), 'A')
+    || setweight(to_tsvector('simple', coalesce((
+        SELECT string_agg(a.artist_name, ' ')
+        FROM discobase_record_artists ra
+        JOIN discobase_artist a ON a.id = ra.artist_id
+        WHERE ra.record_id = r.id), '')), 'A')
+    || setweight(to_tsvector('simple', coalesce((
+        SELECT string_agg(l.label_name, ' ')
+        FROM discobase_record_labels rl
+        JOIN discobase_label l ON l.id = rl.label_id
+        WHERE rl.record_id = r.id), '')), 'B')
+    || setweight(to_tsvector('simple', coalesce((
+        SELECT g.genre_name FROM discobase_genre g
+        WHERE g.id = r.genre_id), '')), 'C')
+    || setweight(to_tsvector('simple', coalesce((
+        SELECT f.format_name FROM discobase_recordformat f
+        WHERE f.id = r.record_format_id), '')), 'C')
+    || setweight(to_tsvector('simple', coalesce((
+        SELECT string_agg(s.title, ' ')
+        FROM discobase_song s
+        WHERE s.record_id = r.id), '')), 'D');
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("discobase", "0021_alter_record_discogs_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="record",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="record_search_vector_gin"
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_SEARCH_VECTOR, migrations.RunSQL.noop),
+    ]
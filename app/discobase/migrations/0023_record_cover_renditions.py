@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("discobase", "0022_record_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="record",
+            name="cover_renditions",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
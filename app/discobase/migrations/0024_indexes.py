@@ -0,0 +1,56 @@
+# Generated by Django 4.2.3 on 2026-10-17 14:05
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("discobase", "0023_record_cover_renditions"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="artist",
+            index=models.Index(
+                django.db.models.functions.text.Upper("artist_name"),
+                name="artist_name_upper_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="label",
+            index=models.Index(
+                django.db.models.functions.text.Upper("label_name"),
+                name="label_name_upper_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(
+                fields=["-purchase_date", "-id"], name="record_purchase_date_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(
+                condition=models.Q(
+                    ("discogs_id__isnull", True),
+                    ("discogs_id__lt", 100),
+                    _connector="OR",
+                ),
+                fields=["id"],
+                name="record_without_discogs_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trxcredit",
+            index=models.Index(
+                fields=["trx_type", "-id"], name="trxcredit_type_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trxcredit",
+            index=models.Index(fields=["trx_date", "id"], name="trxcredit_date_id_idx"),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+# the table of the default chart cache (see CACHES in settings), as created
+# by `manage.py createcachetable`, which other database caches need instead
+CHART_CACHE_TABLE = "discobase_chart_cache"
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("discobase", "0024_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [
+                f"""
+                CREATE TABLE IF NOT EXISTS {CHART_CACHE_TABLE} (
+                    cache_key varchar(255) NOT NULL PRIMARY KEY,
+                    value text NOT NULL,
+                    expires timestamp with time zone NOT NULL
+                )
+                """,
+                f"CREATE INDEX IF NOT EXISTS {CHART_CACHE_TABLE}_expires "
+                f"ON {CHART_CACHE_TABLE} (expires)",
+            ],
+            f"DROP TABLE IF EXISTS {CHART_CACHE_TABLE}",
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.3 on 2026-10-17 21:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("discobase", "0025_cache_tables"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="artist",
+            name="artist_name_upper_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="label",
+            name="label_name_upper_idx",
+        ),
+    ]
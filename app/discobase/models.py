@@ -1,11 +1,19 @@
 from datetime import datetime
 
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
 from django.forms import ImageField, IntegerField
 from django.urls import reverse
 from django.utils.functional import cached_property
 
+from discobase.covers import RENDITIONS, WIDTHS_KEY
+from discobase.pagination import KeysetPaginator
+
 
 def validate_credit_trx(value):
     if value in ["Addition", "Initial Load", "Purchase", "Removal"]:
@@ -81,6 +89,37 @@ class RecordFormat(models.Model):
         return self.format_name
 
 
+def joined_names(model, field: str, delimiter: str) -> Coalesce:
+    """Return a subquery joining the `field` values of all `model` rows
+    related to the outer record (in insertion order) into a single string.
+    `model` is a model with a `record` foreign key, e.g. a m2m through model.
+    """
+    names = (
+        model.objects.filter(record_id=OuterRef("pk"))
+        .order_by()
+        .values("record_id")
+        .annotate(names=StringAgg(field, delimiter=delimiter, ordering="id"))
+        .values("names")
+    )
+    return Coalesce(Subquery(names), Value(""), output_field=TextField())
+
+
+class RecordQuerySet(models.QuerySet):
+    def with_display_data(self):
+        """Fetch genre and format with a join and the artists and labels
+        strings as subqueries, so that displaying a record (`str(record)`,
+        `artists_str`, `labels_str`) needs no additional query. The
+        annotations are stored under the names of the cached properties
+        and take their place.
+        """
+        return self.select_related("genre", "record_format").annotate(
+            artists_str=joined_names(
+                Record.artists.through, "artist__artist_name", " / "
+            ),
+            labels_str=joined_names(Record.labels.through, "label__label_name", " / "),
+        )
+
+
 class Record(models.Model):
     # id = models.AutoField(primary_key=True)  # TODO: check if UUID is better
     title = models.CharField(max_length=255)
@@ -107,10 +146,17 @@ class Record(models.Model):
     cover_image = models.ImageField(
         upload_to="covers/", default="covers/_placeholder.png"
     )
+    # filenames of the resized cover versions by name and a checksum of the
+    # cover (see discobase.covers)
+    cover_renditions = models.JSONField(default=dict, blank=True, editable=False)
     discogs_id = models.IntegerField(default=-1)
+    # denormalized search document, maintained by discobase.search (see signals)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = RecordQuerySet.as_manager()
+
     # NOTE: I cannot use m2m fields in the constraint, so this ist the best I can do ...
     class Meta:
         constraints = [
@@ -118,6 +164,19 @@ class Record(models.Model):
                 fields=["title", "year", "genre"], name="record_unique"
             )
         ]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="record_search_vector_gin"),
+            # ordering of the record list (and its keyset pagination)
+            models.Index(
+                fields=["-purchase_date", "-id"], name="record_purchase_date_id_idx"
+            ),
+            # the few records without a valid discogs id (see discogs.py)
+            models.Index(
+                fields=["id"],
+                condition=Q(discogs_id__isnull=True) | Q(discogs_id__lt=100),
+                name="record_without_discogs_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.artists_str} - {self.title} ({str(self.year)})"
@@ -125,25 +184,85 @@ class Record(models.Model):
     def get_absolute_url(self):
         return reverse("discobase:record_detail", args=[str(self.pk)])
 
+    def get_cover_urls(self) -> dict[str, str]:
+        """Return the urls of the cover renditions by name."""
+        return {
+            name: reverse(
+                "discobase:cover_rendition",
+                args=[self.cover_renditions[name].split("/")[-1]],
+            )
+            for name in RENDITIONS
+            if name in self.cover_renditions
+        }
+
+    def get_cover_srcset(self) -> str:
+        """Return the `srcset` of the cover renditions, with their width
+        (or their box size, for renditions rendered without the width).
+        """
+        urls = self.get_cover_urls()
+        widths = self.cover_renditions.get(WIDTHS_KEY, {})
+        return ", ".join(
+            f"{urls[name]} {widths.get(name, size)}w"
+            for name, (size, _) in RENDITIONS.items()
+            if name in urls
+        )
+
     def get_discogs_url(self):
         return f"https://www.discogs.com/release/{str(self.discogs_id)}"
 
+    def get_neighbors(self, queryset=None) -> tuple[int | None, int | None]:
+        """Return the ids of the previous and the next record, in the
+        ordering of the passed queryset (default: all records by id).
+        Both are looked up with one query (with a keyset seek for each,
+        see `KeysetPaginator.seek`) and cached on the instance. At the ends of
+        the collection (or if the record is not part of the queryset)
+        None is returned instead of an id.
+        """
+        if queryset is None:
+            queryset = Record.objects.order_by("id")
+        ordering = tuple(queryset.query.order_by) or ("id",)
+        paginator = KeysetPaginator(queryset, 1, ordering)
+        values = [OuterRef(name) for name in paginator.fields]
+
+        def seek(forward: bool) -> Subquery:
+            return Subquery(paginator.seek(values, forward).values("pk")[:1])
+
+        neighbors = (
+            queryset.filter(pk=self.pk)
+            .order_by()
+            .annotate(previous_id=seek(False), next_id=seek(True))
+            .values_list("previous_id", "next_id")
+        )
+        cache = self.__dict__.setdefault("_neighbors_cache", {})
+        key = neighbors.query.sql_with_params()
+        if key not in cache:
+            cache[key] = next(iter(neighbors), (None, None))
+        return cache[key]
+
     def get_next_records_url(self):
-        next_record = Record.objects.filter(id__gt=self.id).order_by("id").first()
-        return next_record.get_absolute_url()
+        next_id = self.get_neighbors()[1]
+        if next_id is None:
+            return None
+        return reverse("discobase:record_detail", args=[str(next_id)])
 
     def get_previous_records_url(self):
-        prev_record = Record.objects.filter(id__lt=self.id).order_by("-id").first()
-        return prev_record.get_absolute_url()
+        previous_id = self.get_neighbors()[0]
+        if previous_id is None:
+            return None
+        return reverse("discobase:record_detail", args=[str(previous_id)])
 
     @cached_property
     def artists_str(self):
-        """NOTE: This probably needs an additional db query, when called."""
+        """NOTE: This needs an additional db query, unless the record
+        was fetched with `Record.objects.with_display_data()`.
+        """
         return " / ".join([x.artist_name for x in self.artists.all()])
 
     @cached_property
     def labels_str(self):
-        """NOTE: This probably needs an additional db query, when called."""
+        """NOTE: This needs an additional db query, unless the record
+        was fetched with `Record.objects.with_display_data()`.
+        """
         return " / ".join([x.label_name for x in self.labels.all()])
 
 
@@ -178,6 +297,14 @@ class TrxCredit(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # last trx of a type, e.g. the last addition (see ledger.py)
+            models.Index(fields=["trx_type", "-id"], name="trxcredit_type_id_idx"),
+            # date ranges of the chart, in chart order
+            models.Index(fields=["trx_date", "id"], name="trxcredit_date_id_idx"),
+        ]
+
     def __repr__(self):
         return f"{self.trx_type} (value={self.trx_value})"
 
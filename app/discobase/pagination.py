@@ -0,0 +1,199 @@
+"""Keyset (cursor) pagination for list views.
+
+Instead of OFFSET pages, a page is addressed by an opaque cursor holding
+the ordering values of the row it starts after (or ends before). Every
+page is then a single index range scan with a LIMIT, so deep pages cost
+the same as the first one and no COUNT(*) query is needed.
+"""
+
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import Http404
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """A page of a `KeysetPaginator`. Mirrors the parts of django's
+    `Page` API the templates use and adds the cursors for the links.
+    """
+
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor, paginator):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate a queryset by the passed ordering, e.g. ("-purchase_date",
+    "-id"). The ordering has to be unique (end with the pk) and should be
+    backed by an index.
+    """
+
+    # cursor pointing at the last page
+    LAST = "last"
+
+    def __init__(self, queryset, per_page: int, ordering: tuple[str, ...]):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip("-") for name in self.ordering]
+
+    def encode_cursor(self, obj, direction: str) -> str:
+        values = [getattr(obj, name) for name in self.fields]
+        values = [v.isoformat() if hasattr(v, "isoformat") else v for v in values]
+        payload = json.dumps({"d": direction, "v": values}, separators=(",", ":"))
+        return urlsafe_base64_encode(payload.encode())
+
+    def decode_cursor(self, cursor: str) -> tuple[str, list]:
+        """Return direction and ordering values of the cursor. Raise
+        InvalidCursor, if the cursor was not issued by this paginator.
+        """
+        try:
+            payload = json.loads(urlsafe_base64_decode(cursor))
+            direction, values = payload["d"], payload["v"]
+            if direction not in ("n", "p") or len(values) != len(self.fields):
+                raise ValueError
+            model_fields = [self.queryset.model._meta.get_field(n) for n in self.fields]
+            return direction, [f.to_python(v) for f, v in zip(model_fields, values)]
+        except Exception as e:
+            raise InvalidCursor(cursor) from e
+
+    def _seek(self, values: list, forward: bool) -> Q:
+        """Return the condition for the rows after (or before) the row
+        with the passed ordering values, i.e. the expanded form of
+        `(f1, f2) > (v1, v2)` respecting each field's direction.
+        """
+        condition = Q()
+        for i, (name, value) in enumerate(zip(self.ordering, values)):
+            descending = name.startswith("-")
+            lookup = "lt" if descending == forward else "gt"
+            step = Q(**{f"{self.fields[i]}__{lookup}": value})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    def _reversed_ordering(self) -> list[str]:
+        return [n[1:] if n.startswith("-") else f"-{n}" for n in self.ordering]
+
+    def seek(self, values: list, forward: bool = True):
+        """Return the rows after (or before) the row with the passed
+        ordering values, nearest first. The values may be expressions,
+        e.g. OuterRefs to the ordering fields of an outer query.
+        """
+        ordering = self.ordering if forward else self._reversed_ordering()
+        return self.queryset.order_by(*ordering).filter(self._seek(values, forward))
+
+    def page(self, cursor: str | None) -> KeysetPage:
+        """Return the page for the cursor (the first page for None)."""
+        queryset, direction, values = self._page_queryset(cursor)
+        return self._make_page(list(queryset), cursor, direction, values)
+
+    async def apage(self, cursor: str | None) -> KeysetPage:
+        """Async version of `page`."""
+        queryset, direction, values = self._page_queryset(cursor)
+        rows = [row async for row in queryset]
+        return self._make_page(rows, cursor, direction, values)
+
+    def _page_queryset(self, cursor: str | None):
+        """Return the queryset of the page's rows and direction and
+        ordering values of the cursor.
+        """
+        if cursor == self.LAST:
+            direction, values = "p", None
+        elif cursor:
+            direction, values = self.decode_cursor(cursor)
+        else:
+            direction, values = "n", None
+
+        forward = direction == "n"
+        if values is not None:
+            queryset = self.seek(values, forward)
+        elif forward:
+            queryset = self.queryset.order_by(*self.ordering)
+        else:
+            queryset = self.queryset.order_by(*self._reversed_ordering())
+        # fetch one row more, to know if there is another page
+        return queryset[: self.per_page + 1], direction, values
+
+    def _make_page(self, rows: list, cursor, direction: str, values) -> KeysetPage:
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if direction == "p":
+            rows.reverse()
+            has_next, has_previous = cursor != self.LAST, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = self.encode_cursor(rows[-1], "n") if rows and has_next else None
+        previous_cursor = (
+            self.encode_cursor(rows[0], "p") if rows and has_previous else None
+        )
+        return KeysetPage(rows, next_cursor, previous_cursor, self)
+
+
+class KeysetPaginationMixin:
+    """Use keyset pagination in a ListView, if `get_keyset_ordering()`
+    returns an ordering (otherwise fall back to django's paginator).
+    """
+
+    keyset_ordering = None
+    cursor_kwarg = "cursor"
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering()
+        if ordering is None:
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, ordering)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """Async version of `paginate_queryset`, the rows of the page
+        are fetched with the async ORM.
+        """
+        ordering = self.get_keyset_ordering()
+        if ordering is None:
+            paginator, page, object_list, is_paginated = await sync_to_async(
+                super().paginate_queryset
+            )(queryset, page_size)
+            page.object_list = [obj async for obj in object_list]
+            return (paginator, page, page.object_list, is_paginated)
+
+        paginator = KeysetPaginator(queryset, page_size, ordering)
+        try:
+            page = await paginator.apage(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,113 @@
+"""Batched removal of records, e.g. for a clean-up of the collection.
+
+Deleting records (also with a queryset's `delete()`) sends pre_delete
+and post_delete signals for each of them, and their receivers (see
+`views.py`) copy the record into the dump and append a removal trx,
+each with queries of their own. `remove_records` copies all records
+into the dump with one INSERT ... SELECT (with the artists and labels
+aggregated into strings, as `send_record_to_dump` does), appends all
+removal trx in one batch and deletes the records and their songs and
+links with raw DELETEs, which send no signals. The number of queries
+does not depend on the number of records.
+"""
+
+from datetime import date
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from discobase import ledger
+from discobase.models import (
+    Artist,
+    Dump,
+    Genre,
+    Label,
+    Record,
+    RecordFormat,
+    Song,
+    TrxCredit,
+)
+
+# the names in the insertion order of the links, see `models.joined_names`
+DUMP_RECORDS = """
+INSERT INTO {dump} (
+    legacy_id, title, year, record_format, color, remarks, genre, artists,
+    labels, purchase_date, price, rating, review, created_at, updated_at
+)
+SELECT
+    r.id, r.title, r.year, f.format_name, r.color, r.remarks, g.genre_name,
+    left(coalesce((
+        SELECT string_agg(a.artist_name, ' / ' ORDER BY ra.id)
+        FROM {record_artists} ra JOIN {artist} a ON a.id = ra.artist_id
+        WHERE ra.record_id = r.id
+    ), ''), 255),
+    left(coalesce((
+        SELECT string_agg(l.label_name, ' / ' ORDER BY rl.id)
+        FROM {record_labels} rl JOIN {label} l ON l.id = rl.label_id
+        WHERE rl.record_id = r.id
+    ), ''), 255),
+    r.purchase_date, r.price, r.rating, r.review, %(now)s, %(now)s
+FROM {record} r
+JOIN {record_format} f ON f.id = r.record_format_id
+JOIN {genre} g ON g.id = r.genre_id
+WHERE r.id = ANY(%(ids)s)
+ORDER BY r.id
+"""
+
+# the related rows of the records (the trx keep their record string)
+DELETE_RECORDS = [
+    "DELETE FROM {record_artists} WHERE record_id = ANY(%(ids)s)",
+    "DELETE FROM {record_labels} WHERE record_id = ANY(%(ids)s)",
+    "DELETE FROM {song} WHERE record_id = ANY(%(ids)s)",
+    "UPDATE {trx} SET record_id = NULL WHERE record_id = ANY(%(ids)s)",
+    "DELETE FROM {record} WHERE id = ANY(%(ids)s)",
+]
+
+
+def remove_records(queryset) -> int:
+    """Move the records of the queryset into the dump and credit their
+    removal (ordered by id), all in one transaction. Return the number
+    of removed records.
+    """
+    using = router.db_for_write(Record)
+    tables = {
+        "dump": Dump._meta.db_table,
+        "record": Record._meta.db_table,
+        "record_artists": Record.artists.through._meta.db_table,
+        "record_labels": Record.labels.through._meta.db_table,
+        "artist": Artist._meta.db_table,
+        "label": Label._meta.db_table,
+        "record_format": RecordFormat._meta.db_table,
+        "genre": Genre._meta.db_table,
+        "song": Song._meta.db_table,
+        "trx": TrxCredit._meta.db_table,
+    }
+    max_length = TrxCredit._meta.get_field("record_string").max_length
+    with transaction.atomic(using=using):
+        records = list(
+            Record.objects.using(using)
+            .filter(pk__in=queryset.values("pk"))
+            .with_display_data()
+            .order_by("id")
+            .select_for_update(of=("self",))
+        )
+        if not records:
+            return 0
+        params = {"ids": [record.pk for record in records], "now": timezone.now()}
+        with connections[using].cursor() as cursor:
+            cursor.execute(DUMP_RECORDS.format(**tables), params)
+            for sql in DELETE_RECORDS:
+                cursor.execute(sql.format(**tables), params)
+        ledger.append_trxs(
+            [
+                TrxCredit(
+                    trx_date=date.today(),
+                    trx_type="Removal",
+                    trx_value=record.credit_value,
+                    record=None,
+                    record_string=str(record)[:max_length],
+                )
+                for record in records
+            ]
+        )
+    return len(records)
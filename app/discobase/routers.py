@@ -0,0 +1,158 @@
+"""Routing of reads to the read replica.
+
+Only the reads of safe (GET / HEAD) requests go to the replica, all
+writes and all other reads (of other requests, management commands,
+transactions) to the primary. After a write, the rest of the request is
+pinned to the primary, and so are the requests of the next
+`REPLICA_PIN_SECONDS` (by a cookie), until the replica caught up. E.g.
+the page shown after a change reads the changed data.
+
+Writes are the data changing statements run on the primary during the
+request (seen by an execute wrapper), not the requests for the write
+database, which also serve reads (e.g. of the ledger's last saldo).
+Writes to the tables of database caches do not pin.
+
+The replica is used with READ_FROM_REPLICA only (i.e. if a REPLICA is
+configured in config_dev), in tests it mirrors the default database.
+"""
+
+from contextlib import ExitStack
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = "replica"
+PIN_COOKIE = "primary_pin"
+SAFE_METHODS = ("GET", "HEAD")
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "MERGE", "TRUNCATE", "COPY")
+
+
+@dataclass
+class RequestState:
+    use_replica: bool
+    wrote: bool = False
+
+
+# the state is mutated, not set, to be seen across sync_to_async contexts
+_request_state: ContextVar[RequestState | None] = ContextVar(
+    "request_state", default=None
+)
+
+
+def _cache_tables() -> list[str]:
+    return [
+        cache["LOCATION"]
+        for cache in settings.CACHES.values()
+        if cache["BACKEND"].endswith(".DatabaseCache")
+    ]
+
+
+class WriteTracker:
+    """Execute wrapper flagging the state of the request on writes."""
+
+    def __init__(self, state: RequestState):
+        self.state = state
+        self.cache_tables = _cache_tables()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.state.wrote and self.is_write(sql):
+            self.state.wrote = True
+        return execute(sql, params, many, context)
+
+    def is_write(self, sql: str) -> bool:
+        statement = sql.split(None, 1)[:1]
+        return (
+            bool(statement)
+            and statement[0].upper() in WRITE_STATEMENTS
+            and not any(f'"{table}"' in sql for table in self.cache_tables)
+        )
+
+
+def _track_writes(stack: ExitStack, state: RequestState) -> None:
+    connection = connections[DEFAULT_DB_ALIAS]
+    stack.enter_context(connection.execute_wrapper(WriteTracker(state)))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if (
+            settings.READ_FROM_REPLICA
+            and state is not None
+            and state.use_replica
+            and not state.wrote
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica is migrated by replication
+        return db != REPLICA
+
+
+class ReplicaPinMiddleware:
+    """Track the requests for the router (see above). Put it before
+    all middleware that reads or writes, e.g. the sessions.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            with ExitStack() as stack:
+                _track_writes(stack, state)
+                response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        # the connections are thread-local, the (async) ORM uses the
+        # ones of the thread its sync parts run in
+        state, token = self.start(request)
+        stack = ExitStack()
+        try:
+            await sync_to_async(_track_writes)(stack, state)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _request_state.reset(token)
+        return self.finish(state, response)
+
+    def start(self, request):
+        state = RequestState(
+            use_replica=request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+        )
+        return state, _request_state.set(state)
+
+    def finish(self, state: RequestState, response):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
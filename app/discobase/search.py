@@ -0,0 +1,97 @@
+"""Full-text search for records.
+
+Every record carries a denormalized search document (`Record.search_vector`)
+with its title, artists, labels, genre, format and songs. The document is
+kept current by the signal receivers in `views.py` and is backed by a GIN
+index, so a search is a single index lookup instead of a sequential scan
+over the m2m joins.
+"""
+
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F, OuterRef, QuerySet, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+from discobase.models import Genre, Record, RecordFormat, Song, joined_names
+
+# 'simple' does no stemming, which suits band names, titles and labels better
+SEARCH_CONFIG = "simple"
+
+
+def _related_name(model, field: str, fk: str) -> Coalesce:
+    """Return a subquery for the `field` value of the `model` row the
+    outer record points to with its foreign key `fk`.
+    """
+    return Coalesce(
+        Subquery(model.objects.filter(pk=OuterRef(fk)).values(field)[:1]),
+        Value(""),
+        output_field=TextField(),
+    )
+
+
+def search_document() -> SearchVector:
+    """Return the weighted search vector expression of a record."""
+    return (
+        SearchVector("title", weight="A", config=SEARCH_CONFIG)
+        + SearchVector(
+            joined_names(Record.artists.through, "artist__artist_name", " "),
+            weight="A",
+            config=SEARCH_CONFIG,
+        )
+        + SearchVector(
+            joined_names(Record.labels.through, "label__label_name", " "),
+            weight="B",
+            config=SEARCH_CONFIG,
+        )
+        + SearchVector(
+            _related_name(Genre, "genre_name", "genre_id"),
+            weight="C",
+            config=SEARCH_CONFIG,
+        )
+        + SearchVector(
+            _related_name(RecordFormat, "format_name", "record_format_id"),
+            weight="C",
+            config=SEARCH_CONFIG,
+        )
+        + SearchVector(
+            joined_names(Song, "title", " "), weight="D", config=SEARCH_CONFIG
+        )
+    )
+
+
+def update_search_vectors(record_ids=None) -> int:
+    """Rebuild the search document of the records with the passed ids
+    (or of all records, if none are passed) in a single UPDATE. Return
+    the number of updated records.
+    """
+    records = Record.objects.all()
+    if record_ids is not None:
+        records = records.filter(pk__in=list(record_ids))
+    return records.update(search_vector=search_document())
+
+
+def build_search_query(text: str | None) -> SearchQuery | None:
+    """Turn the user input into a prefix-matching tsquery, so that
+    'dism' finds 'Dismember'. All terms have to match. Return None,
+    if the input contains no searchable terms.
+    """
+    terms = re.findall(r"\w+", text or "")
+    if not terms:
+        return None
+    raw_query = " & ".join(f"{term}:*" for term in terms)
+    return SearchQuery(raw_query, search_type="raw", config=SEARCH_CONFIG)
+
+
+def search_records(text: str | None, queryset: QuerySet | None = None) -> QuerySet:
+    """Return the records matching the search text, best matches first."""
+    if queryset is None:
+        queryset = Record.objects.all()
+    query = build_search_query(text)
+    if query is None:
+        return queryset.none()
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(rank=SearchRank(F("search_vector"), query))
+        .order_by("-rank", "-purchase_date", "-id")
+    )
@@ -0,0 +1,270 @@
+"""Synthetic data for benchmarks: a record collection with countries,
+artists, labels and songs, and a consistent credit ledger. All rows are
+inserted set-based with INSERT ... SELECT FROM generate_series, so even
+millions of rows take only seconds. Seeding again adds another batch.
+
+The ledger continues from the last saldo: every new record gets a
+purchase trx (at its purchase date) preceded by an addition paying for
+it. On top, `trx` unrelated trx alternate between additions and
+purchases. So the running saldo is correct and stays small.
+
+NOTE: Not meant for a production database.
+"""
+
+from django.db import connections
+from django.utils import timezone
+
+from discobase import ledger
+from discobase.models import (
+    Artist,
+    Country,
+    Genre,
+    Label,
+    Record,
+    RecordFormat,
+    Song,
+    TrxCredit,
+)
+from discobase.search import search_document
+
+COUNTRIES = [
+    ("Sweden", "SE"),
+    ("Finland", "FI"),
+    ("Norway", "NO"),
+    ("United States", "US"),
+    ("Germany", "DE"),
+    ("United Kingdom", "GB"),
+    ("Netherlands", "NL"),
+    ("Poland", "PL"),
+    ("Brazil", "BR"),
+    ("Japan", "JP"),
+]
+GENRES = ["Death Metal", "Black Metal", "Thrash Metal", "Doom Metal", "Grindcore"]
+FORMATS = ["LP", "EP", "Single", "Tape", "Box"]
+ADJECTIVES = [
+    "Morbid", "Rotten", "Eternal", "Unholy", "Cursed", "Infernal", "Putrid",
+    "Funeral", "Abysmal", "Frozen", "Bleeding", "Obscure", "Ancient",
+    "Wretched", "Sacred", "Hollow", "Savage", "Crimson", "Withered",
+]  # fmt: skip
+NOUNS = [
+    "Grave", "Torment", "Crypt", "Throne", "Carnage", "Tomb", "Abyss", "Ritual",
+    "Decay", "Oath", "Plague", "Mausoleum", "Serpent", "Winter", "Altar",
+    "Void", "Bones", "Chalice", "Dominion", "Pestilence", "Coffin", "Shrine",
+    "Horde",
+]  # fmt: skip
+
+# a name of two words from the lists (with a number, to be unique)
+NAME = """
+(%(adjectives)s::text[])[1 + ({n}) %% cardinality(%(adjectives)s::text[])]
+|| ' ' || (%(nouns)s::text[])[1 + ({n}) * 7 %% cardinality(%(nouns)s::text[])]
+"""
+
+INSERT_ARTISTS = """
+INSERT INTO {artist} (artist_name, country_id, created_at, updated_at)
+SELECT
+    {name} || ' ' || (%(offset)s + i),
+    (%(countries)s::bigint[])[1 + i %% cardinality(%(countries)s::bigint[])],
+    %(now)s, %(now)s
+FROM generate_series(1, %(count)s) i
+"""
+
+INSERT_LABELS = """
+INSERT INTO {label} (label_name, created_at, updated_at)
+SELECT
+    (%(nouns)s::text[])[1 + i %% cardinality(%(nouns)s::text[])]
+    || ' Records ' || (%(offset)s + i),
+    %(now)s, %(now)s
+FROM generate_series(1, %(count)s) i
+"""
+
+# purchase dates ascending with the ids, spread over 19 years
+INSERT_RECORDS = """
+INSERT INTO {record} (
+    title, year, record_format_id, color, remarks, genre_id, purchase_date,
+    price, is_digitized, credit_value, rating, review, cover_image,
+    cover_renditions, discogs_id, created_at, updated_at
+)
+SELECT
+    {name} || ' ' || (%(offset)s + i),
+    1985 + i %% 39,
+    (%(formats)s::bigint[])[1 + i %% cardinality(%(formats)s::bigint[])],
+    CASE WHEN i %% 5 = 0 THEN 'red' ELSE 'black' END,
+    '',
+    (%(genres)s::bigint[])[1 + i %% cardinality(%(genres)s::bigint[])],
+    date '2005-01-01' + (i::bigint * 7000 / %(count)s)::int,
+    15 + i %% 20, i %% 3 = 0, 1, i %% 6, '', %(cover_image)s, '{{}}',
+    CASE WHEN i %% 100 = 0 THEN -1 ELSE 100000 + %(offset)s + i END,
+    %(now)s, %(now)s
+FROM generate_series(1, %(count)s) i
+"""
+
+# link the n-th new record to the (n + offset mod count)-th new artist
+# (or label), but only every `every`-th record
+INSERT_LINKS = """
+INSERT INTO {through} (record_id, {column})
+SELECT r.id, x.id
+FROM (
+    SELECT id, row_number() OVER (ORDER BY id) AS n
+    FROM {record} WHERE id > %(last_record)s
+) r
+JOIN (
+    SELECT id, row_number() OVER (ORDER BY id) - 1 AS n
+    FROM {table} WHERE id > %(last_id)s
+) x ON x.n = (r.n + %(offset)s) %% %(count)s
+WHERE r.n %% %(every)s = 0
+"""
+
+# sides A and B with four songs each
+INSERT_SONGS = """
+INSERT INTO {song} (record_id, position, title, is_favourite, created_at, updated_at)
+SELECT
+    r.id,
+    CASE WHEN s <= 4 THEN 'A' ELSE 'B' END || ((s - 1) %% 4 + 1),
+    {name},
+    s = 1,
+    %(now)s, %(now)s
+FROM {record} r CROSS JOIN generate_series(1, 8) s
+WHERE r.id > %(last_record)s
+"""
+
+INSERT_TRX = """
+INSERT INTO {trx} (
+    trx_date, trx_type, trx_value, credit_saldo, record_id, record_string,
+    created_at, updated_at
+)
+SELECT
+    trx_date, trx_type, trx_value,
+    %(last_saldo)s + SUM(trx_value) OVER (ORDER BY trx_date, seq),
+    record_id, record_string, %(now)s, %(now)s
+FROM (
+    SELECT
+        purchase_date AS trx_date, 2 * id AS seq, 'Addition' AS trx_type,
+        1 AS trx_value, NULL::bigint AS record_id, NULL AS record_string
+    FROM {record} WHERE id > %(last_record)s
+    UNION ALL
+    SELECT
+        r.purchase_date, 2 * r.id + 1, 'Purchase', -1, r.id,
+        left((
+            SELECT string_agg(a.artist_name, ' / ' ORDER BY ra.id)
+            FROM {artists_through} ra JOIN {artist} a ON a.id = ra.artist_id
+            WHERE ra.record_id = r.id
+        ) || ' - ' || r.title || ' (' || r.year || ')', 200)
+    FROM {record} r WHERE r.id > %(last_record)s
+    UNION ALL
+    SELECT
+        date '2005-01-01' + (i::bigint * 7000 / %(count)s)::int, -i,
+        CASE WHEN i %% 2 = 0 THEN 'Addition' ELSE 'Purchase' END,
+        CASE WHEN i %% 2 = 0 THEN 1 ELSE -1 END,
+        NULL, NULL
+    FROM generate_series(1, %(count)s) i
+) trx
+ORDER BY trx_date, seq
+"""
+
+
+def _last_id(model, using: str) -> int:
+    return (
+        model.objects.using(using).order_by("-id").values_list("id", flat=True).first()
+        or 0
+    )
+
+
+def seed(
+    records: int = 200_000,
+    trx: int = 1_000_000,
+    search_vectors: bool = False,
+    using: str = "default",
+) -> dict[str, int]:
+    """Insert `records` records with eight songs each, a quarter as many
+    artists (every tenth record is a split of two artists), a twentieth
+    as many labels and their purchase trx (see above), plus `trx` further
+    trx. Building the search vectors of the new records is optional, as
+    it takes the longest. Return the number of inserted rows per table.
+    NOTE: Run it in a transaction, it does not lock the ledger.
+    """
+    now = timezone.now()
+    countries = [
+        Country.objects.using(using)
+        .get_or_create(country_code=code, defaults={"country_name": name})[0]
+        .pk
+        for name, code in COUNTRIES
+    ]
+    genres = [
+        Genre.objects.using(using).get_or_create(genre_name=name)[0].pk
+        for name in GENRES
+    ]
+    formats = [
+        RecordFormat.objects.using(using).get_or_create(format_name=name)[0].pk
+        for name in FORMATS
+    ]
+    tables = {
+        "artist": Artist._meta.db_table,
+        "label": Label._meta.db_table,
+        "record": Record._meta.db_table,
+        "song": Song._meta.db_table,
+        "trx": TrxCredit._meta.db_table,
+        "artists_through": Record.artists.through._meta.db_table,
+    }
+    params = {
+        "now": now,
+        "adjectives": ADJECTIVES,
+        "nouns": NOUNS,
+        "countries": countries,
+        "genres": genres,
+        "formats": formats,
+        "cover_image": Record._meta.get_field("cover_image").default,
+        "last_record": _last_id(Record, using),
+        "last_saldo": ledger.get_last_saldo(using),
+    }
+    counts = {
+        "artist": max(records // 4, 1) if records else 0,
+        "label": max(records // 20, 1) if records else 0,
+        "record": records,
+        "song": records * 8,
+        "trx": records * 2 + trx,
+    }
+    last_ids = {"artist": _last_id(Artist, using), "label": _last_id(Label, using)}
+    links = [
+        (Record.artists.through, "artist_id", Artist, "artist", 1, 0),
+        (Record.artists.through, "artist_id", Artist, "artist", 10, 1),
+        (Record.labels.through, "label_id", Label, "label", 1, 0),
+    ]
+
+    with connections[using].cursor() as cursor:
+
+        def insert(sql, **kwargs):
+            cursor.execute(sql.format(**tables, **kwargs), {**params, **kwargs})
+
+        if records:
+            insert(
+                INSERT_ARTISTS,
+                name=NAME.format(n="i"),
+                offset=last_ids["artist"],
+                count=counts["artist"],
+            )
+            insert(INSERT_LABELS, offset=last_ids["label"], count=counts["label"])
+            insert(
+                INSERT_RECORDS,
+                name=NAME.format(n="i * 3"),
+                offset=params["last_record"],
+                count=records,
+            )
+            for through, column, model, name, every, offset in links:
+                insert(
+                    INSERT_LINKS,
+                    through=through._meta.db_table,
+                    column=column,
+                    table=model._meta.db_table,
+                    last_id=last_ids[name],
+                    count=counts[name],
+                    every=every,
+                    offset=offset,
+                )
+            insert(INSERT_SONGS, name=NAME.format(n="r.id + s"))
+        insert(INSERT_TRX, count=trx)
+
+    if search_vectors and records:
+        Record.objects.using(using).filter(id__gt=params["last_record"]).update(
+            search_vector=search_document()
+        )
+    return counts
@@ -19,11 +19,47 @@ urlpatterns = [
         views.TrxCreditListView.as_view(),
         name="trxcredit_list",
     ),
+    path(
+        "trxcredit_export/<str:export_format>/",
+        views.TrxCreditExportView.as_view(),
+        name="trxcredit_export",
+    ),
     path(
         "trxcredit_chart/",
         views.TrxCreditChartView.as_view(),
         name="trxcredit_chart",
     ),
+    path(
+        "api/trxcredit_series/",
+        views.TrxCreditSeriesView.as_view(),
+        name="trxcredit_series",
+    ),
+    # async versions (for ASGI servers)
+    path(
+        "async/record_list/",
+        views.AsyncRecordListView.as_view(),
+        name="record_list_async",
+    ),
+    path(
+        "async/<int:pk>/",
+        views.AsyncRecordDetailView.as_view(),
+        name="record_detail_async",
+    ),
+    path(
+        "async/api/trxcredit_series/",
+        views.AsyncTrxCreditSeriesView.as_view(),
+        name="trxcredit_series_async",
+    ),
+    path(
+        "covers/<str:filename>",
+        views.CoverRenditionView.as_view(),
+        name="cover_rendition",
+    ),
+    path(
+        "api/request_stats/",
+        views.RequestStatsView.as_view(),
+        name="request_stats",
+    ),
     path(
         "search_TEMP/",
         views.search_TEMP,
@@ -1,87 +1,435 @@
-from datetime import date, timedelta
-
-from django.http import HttpResponse
-from django.db.models import Q
+import csv
+import json
+from datetime import date, datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.db import transaction
 from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.shortcuts import render
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.views.generic import DetailView, ListView, View
 
-from discobase.charts import make_trxcredit_chart
+from discobase import covers, ledger
+from discobase.chart_cache import (
+    aget_ledger_version,
+    aget_or_build_series,
+    bump_ledger_version,
+    get_ledger_version,
+    get_or_build_series,
+)
+from discobase.charts import (
+    aget_trxcredit_series,
+    get_chart_trx,
+    get_trxcredit_series,
+    serialize_trxcredit_series,
+)
+from discobase.choices import format_choices, genre_choices
+from discobase.filters import afacet_counts, facet_counts, filter_records
 from discobase.forms import DateForm, SearchForm
-from discobase.models import Dump, Record, TrxCredit
-
-
-class RecordListView(ListView):
+from discobase.ingest import purchase_trx
+from discobase.instrumentation import request_stats
+from discobase.models import (
+    Artist,
+    Dump,
+    Genre,
+    Label,
+    Record,
+    RecordFormat,
+    Song,
+    TrxCredit,
+)
+from discobase.pagination import KeysetPaginationMixin
+from discobase.search import search_records, update_search_vectors
+
+
+class RecordListView(KeysetPaginationMixin, ListView):
     model = Record
     context_object_name = "record_list"
     paginate_by = 50
+    keyset_ordering = ("-purchase_date", "-id")
+
+    def get_keyset_ordering(self):
+        """Search results are ordered by rank and therefore
+        paginated by page number. The full list is paginated
+        with a cursor (see `discobase.pagination`).
+        """
+        if self.request.GET.get("q"):
+            return None
+        return self.keyset_ordering
 
     def get_queryset(self):
         """Override default queryset by filtering for the
-        input from the navbar search window. If there is none
+        input from the navbar search window (ranked full-text
+        search, see `discobase.search`) and the fields of the
+        filter form (see `discobase.filters`). If there is none
         return all records.
-        NOTE: This might slow down the base list page. Maybe I
-        should make a separate RecordSearchListView.
         """
         query = self.request.GET.get("q")
+        records = Record.objects.with_display_data()
+        self.filter_form = SearchForm(self.request.GET)
+        if self.filter_form.is_valid():
+            records = filter_records(records, self.filter_form.cleaned_data)
         if not query:
-            return Record.objects.all().order_by("-purchase_date")
+            return records.order_by("-purchase_date")
         else:
-            return Record.objects.filter(
-                Q(title__icontains=query)
-                | Q(artists__artist_name__icontains=query)
-                | Q(labels__label_name__icontains=query)
-                | Q(record_format__format_name=query)
-            )
+            return search_records(query, records)
+
+    def get_facet_arguments(self) -> tuple:
+        """Return the arguments of `facet_counts`: the search results (or
+        all records), the valid filters and the values of the facets.
+        """
+        query = self.request.GET.get("q")
+        records = search_records(query) if query else Record.objects.all()
+        form = self.filter_form
+        cleaned_data = form.cleaned_data if form.is_valid() else {}
+        return records, cleaned_data, form.get_facet_values()
+
+    def get_context_data(self, counts=None, **kwargs):
+        """Add the filter form, with the facet counts of the search
+        results (or of all records) beside its choices, and the query
+        string to keep filters and search in the pagination links. The
+        `counts` are computed, unless passed.
+        """
+        context = super().get_context_data(**kwargs)
+        if counts is None:
+            counts = facet_counts(*self.get_facet_arguments())
+        self.filter_form.set_facet_counts(counts)
+        context["filter_form"] = self.filter_form
+        context["query_string"] = pagination_query_string(self.request.GET)
+        return context
+
+
+def pagination_query_string(params) -> str:
+    """Return the query parameters to keep in the pagination links."""
+    params = params.copy()
+    params.pop("cursor", None)
+    params.pop("page", None)
+    return params.urlencode()
+
+
+class AsyncRecordListView(RecordListView):
+    """Async version of the RecordListView (for ASGI servers). The page
+    and the facet counts are fetched with the async ORM, the rest (e.g.
+    the form validation and the context, which may read the choices)
+    runs sync.
+    """
 
+    async def get(self, request, *args, **kwargs):
+        self.object_list = await sync_to_async(self.get_queryset)()
+        page_size = self.get_paginate_by(self.object_list)
+        self.pagination = await self.apaginate_queryset(self.object_list, page_size)
+        facet_arguments = await sync_to_async(self.get_facet_arguments)()
+        counts = await afacet_counts(*facet_arguments)
+        context = await sync_to_async(self.get_context_data)(counts=counts)
+        return self.render_to_response(context)
 
-class TrxCreditListView(ListView):
+    def paginate_queryset(self, queryset, page_size):
+        # already paginated by get()
+        return self.pagination
+
+
+class TrxCreditListView(KeysetPaginationMixin, ListView):
     model = TrxCredit
     context_object_name = "trxcredit_list"
     queryset = TrxCredit.objects.order_by("-id")
+    paginate_by = 50
+    keyset_ordering = ("-id",)
+
+
+class Echo:
+    """Pseudo-buffer for csv.writer, which returns the written
+    row instead of storing it (see the django docs on streaming
+    large csv files).
+    """
+
+    def write(self, value):
+        return value
+
+
+class TrxCreditExportView(View):
+    """Stream the whole trx ledger as csv or json. The rows are
+    fetched in chunks (with a server-side cursor) and written out
+    one by one, so memory stays flat however long the history gets.
+    """
+
+    fields = (
+        "id",
+        "trx_date",
+        "trx_type",
+        "trx_value",
+        "credit_saldo",
+        "record_id",
+        "record_string",
+    )
+    chunk_size = 2000
+
+    def get(self, request, export_format):
+        rows = (
+            TrxCredit.objects.order_by("id")
+            .values_list(*self.fields)
+            .iterator(chunk_size=self.chunk_size)
+        )
+        if export_format == "csv":
+            content, content_type = self.stream_csv(rows), "text/csv"
+        elif export_format == "json":
+            content, content_type = self.stream_json(rows), "application/json"
+        else:
+            raise Http404(f"Export format '{export_format}' not supported.")
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="trxcredit_{date.today()}.{export_format}"'
+        )
+        return response
+
+    def stream_csv(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.fields)
+        for row in rows:
+            yield writer.writerow(row)
+
+    def stream_json(self, rows):
+        yield "["
+        for i, row in enumerate(rows):
+            separator = "," if i else ""
+            yield separator + json.dumps(
+                dict(zip(self.fields, row)), cls=DjangoJSONEncoder
+            )
+        yield "]"
 
 
 class RecordDetailView(DetailView):
     model = Record
     context_object_name = "record"
+    queryset = Record.objects.with_display_data()
+    # orderings to navigate in, the default is by id
+    neighbor_orderings = {
+        "id": ("id",),
+        "purchase_date": ("-purchase_date", "-id"),
+    }
+
+    def get_neighbor_queryset(self):
+        """Return the records to navigate through with the previous and
+        next links: the search results for the search term `q` or all
+        records in the ordering given by `order`.
+        """
+        query = self.request.GET.get("q")
+        if query:
+            return search_records(query)
+        ordering = self.neighbor_orderings.get(
+            self.request.GET.get("order"), self.neighbor_orderings["id"]
+        )
+        return Record.objects.order_by(*ordering)
+
+    def get_neighbor_urls(self, neighbors) -> dict[str, str | None]:
+        """Return the urls of the previous and next record (with the ids
+        of `neighbors`), keeping the query string (and therefore the
+        navigation order).
+        """
+        query_string = self.request.GET.urlencode()
+        urls = {}
+        for name, neighbor_id in zip(("previous_url", "next_url"), neighbors):
+            url = None
+            if neighbor_id is not None:
+                url = reverse("discobase:record_detail", args=[str(neighbor_id)])
+                if query_string:
+                    url = f"{url}?{query_string}"
+            urls[name] = url
+        return urls
+
+    def get_context_data(self, **kwargs):
+        """Add the urls of the previous and next record."""
+        context = super().get_context_data(**kwargs)
+        neighbors = self.object.get_neighbors(self.get_neighbor_queryset())
+        context.update(self.get_neighbor_urls(neighbors))
+        return context
+
+
+class AsyncRecordDetailView(RecordDetailView):
+    """Async version of the RecordDetailView (for ASGI servers). The
+    record is fetched with the async ORM, the neighbors run sync.
+    """
+
+    async def get(self, request, pk):
+        try:
+            record = await self.queryset.aget(pk=pk)
+        except Record.DoesNotExist:
+            raise Http404("No record found matching the query.")
+        self.object = record
+        neighbors = await sync_to_async(record.get_neighbors)(
+            self.get_neighbor_queryset()
+        )
+        context = {"record": record, "object": record, "view": self}
+        context.update(self.get_neighbor_urls(neighbors))
+        return TemplateResponse(request, self.get_template_names(), context)
 
 
 class TrxCreditChartView(View):
     def get(self, request):
-        # First, check if an addition trx has to be added
-        # TODO This is not very efficient, and if it stays here, then change
-        # the function to read from trx directly, so we hit the db only once
-        create_addition_credits(TrxCredit)
-        result = self.display_trxcredit_chart(request)
-        return HttpResponse(result)
+        # NOTE: Addition trx are created by the scheduled management
+        # command `create_addition_credits`, this view only reads.
+        return self.display_trxcredit_chart(request)
 
     def display_trxcredit_chart(self, request):
         """Display the credittrx_chart. Start- and end date
-        can be changed by the user (using the DateForm).
+        can be changed by the user (using the DateForm). The
+        chart is drawn in the browser, with the data fetched
+        from the TrxCreditSeriesView.
         """
-        trx = (
-            TrxCredit.objects.exclude(trx_type="Initial Load")
-            .filter(trx_date__year__gte="2021")
-            .order_by("trx_date", "id", "trx_type")
+        context = {"form": DateForm}
+        return TemplateResponse(request, "discobase/trxcredit_chart.html", context)
+
+
+def parse_chart_date(value: str | None) -> date | None:
+    """Return the date of a chart date parameter (None for an empty
+    one). Raise ValueError, if it is not an iso date.
+    """
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f"Invalid date '{value}'.")
+    return parsed
+
+
+def request_ledger_version(request) -> tuple[str, datetime]:
+    """Return the ledger version, read from the cache once per request."""
+    if not hasattr(request, "_ledger_version"):
+        request._ledger_version = get_ledger_version()
+    return request._ledger_version
+
+
+def trxcredit_series_etag(request, version: str | None = None) -> str:
+    if version is None:
+        version, _ = request_ledger_version(request)
+    return f"{version}-{request.GET.get('start_date', '')}-{request.GET.get('end_date', '')}"
+
+
+def trxcredit_series_last_modified(request) -> datetime:
+    _, modified = request_ledger_version(request)
+    return modified
+
+
+class TrxCreditSeriesView(View):
+    """Return the trx series of the chart as columnar json (see
+    `charts.serialize_trxcredit_series`). Responses carry the ledger
+    version as ETag, so unchanged series are answered with a 304,
+    and are cached until the ledger changes.
+    """
+
+    @method_decorator(cache_control(no_cache=True))
+    @method_decorator(
+        condition(
+            etag_func=trxcredit_series_etag,
+            last_modified_func=trxcredit_series_last_modified,
+        )
+    )
+    def get(self, request):
+        try:
+            start_date = parse_chart_date(request.GET.get("start_date"))
+            end_date = parse_chart_date(request.GET.get("end_date"))
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        series = get_or_build_series(
+            start_date,
+            end_date,
+            lambda: serialize_trxcredit_series(
+                get_trxcredit_series(get_chart_trx(start_date, end_date))
+            ),
+            version=request_ledger_version(request)[0],
         )
-        start_date = request.GET.get("start_date")
-        end_date = request.GET.get("end_date")
+        return JsonResponse(series)
 
-        if start_date:
-            trx = trx.filter(trx_date__gte=start_date)
-        if end_date:
-            trx = trx.filter(trx_date__lte=end_date)
 
-        chart = make_trxcredit_chart(trx)
-        context = {"chart": chart, "form": DateForm}
-        return render(request, "discobase/trxcredit_chart.html", context)
+class AsyncTrxCreditSeriesView(View):
+    """Async version of the TrxCreditSeriesView (for ASGI servers),
+    with the same ETag / Last-Modified handling. The series is built
+    with the async ORM.
+    """
+
+    async def get(self, request):
+        try:
+            start_date = parse_chart_date(request.GET.get("start_date"))
+            end_date = parse_chart_date(request.GET.get("end_date"))
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        version, modified = await aget_ledger_version()
+        etag = quote_etag(trxcredit_series_etag(request, version))
+        last_modified = int(modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            series = await aget_or_build_series(
+                start_date,
+                end_date,
+                lambda: self.abuild_series(start_date, end_date),
+                version=version,
+            )
+            response = JsonResponse(series)
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    async def abuild_series(self, start_date, end_date) -> dict:
+        series = await aget_trxcredit_series(get_chart_trx(start_date, end_date))
+        return serialize_trxcredit_series(series)
+
+
+@method_decorator(
+    cache_control(public=True, max_age=365 * 24 * 60 * 60, immutable=True),
+    name="get",
+)
+class CoverRenditionView(View):
+    """Serve a cover rendition (see `covers.py`). The filenames contain
+    a hash of the content, so browsers and proxies may cache them forever.
+    """
+
+    def get(self, request, filename):
+        if not covers.is_rendition_name(filename):
+            raise Http404("No cover rendition.")
+        path = settings.MEDIA_ROOT / covers.RENDITION_DIR / filename
+        if not path.is_file():
+            raise Http404("No cover rendition.")
+        extension = filename.rsplit(".", 1)[-1]
+        response = FileResponse(open(path, "rb"), content_type=f"image/{extension}")
+        response["ETag"] = f'"{filename.split(".")[-2]}"'
+        return response
+
+
+@method_decorator(staff_member_required, name="get")
+class RequestStatsView(View):
+    """Return the request stats of this process per url name (see
+    `instrumentation.py`), for staff only.
+    """
+
+    def get(self, request):
+        return JsonResponse(request_stats.summary())
 
 
 # TODO for testing only
 def search_TEMP(request):
-    from discobase.choices import format_choices
-
     context = {"form": SearchForm, "format_choices": format_choices}
     return render(request, "discobase/search_TEMP.html", context)
 
@@ -103,20 +451,8 @@ def create_purchase_trx(record) -> None:
     of the newly created record. This function is called
     everytime a record is saved.
     """
-    trx_value = record.credit_value * -1
-    if not TrxCredit.objects.exists():
-        credit_saldo = 0
-    else:
-        credit_saldo = TrxCredit.objects.order_by("-id").first().credit_saldo
-
-    _ = TrxCredit.objects.create(
-        trx_date=record.purchase_date,
-        trx_type="Purchase",
-        trx_value=trx_value,
-        credit_saldo=credit_saldo + trx_value,
-        record=record,
-        record_string=None,  # it misses the artist part (m2m) in this state, see next
-    )
+    # the record string misses the artist part (m2m) in this state, see next
+    _ = ledger.append_trxs([purchase_trx(record, record_string=None)])
 
 
 @receiver(m2m_changed, sender=Record.artists.through)
@@ -135,56 +471,86 @@ def record_m2m_update_post_save(sender, instance, action, *args, **kwargs) -> No
             pass
 
 
-# CREATE REGULAR ADDITION TRX
+# KEEP THE SEARCH DOCUMENT UP TO DATE
 
 
-def create_addition_credits(TrxCredit, interval_days: int = 14) -> None:
-    """Every x days a new credit is added (to be spent
-    on purchasing new records). This function checks
-    the delta in days since the last addition and inserts
-    the necessary credit transactions depending on the
-    defined interval.
+@receiver(post_save, sender=Record)
+def record_search_post_save(sender, instance, **kwargs) -> None:
+    """Listen to a record post_save() signal and rebuild
+    the search document of the saved record.
     """
-    last_addition_date, days_since_last = get_days_since_last_addition(
-        TrxCredit, interval_days
-    )
+    update_search_vectors([instance.pk])
 
-    while days_since_last >= interval_days:
-        trx_date = last_addition_date + timedelta(days=interval_days)
 
-        _ = TrxCredit.objects.create(
-            trx_date=trx_date,
-            trx_type="Addition",
-            trx_value=1,
-            credit_saldo=(TrxCredit.objects.order_by("-id").first().credit_saldo + 1),
-            record=None,
-            record_string=None,
-        )
-        last_addition_date, days_since_last = get_days_since_last_addition(
-            TrxCredit, interval_days
+@receiver(m2m_changed, sender=Record.artists.through)
+@receiver(m2m_changed, sender=Record.labels.through)
+def record_search_m2m_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+) -> None:
+    """Listen to changes in the record-artists and record-labels
+    relations and rebuild the search document of the affected
+    records. For a reverse 'clear' (e.g. `artist.records.clear()`)
+    the affected records have to be collected before the clear.
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            update_search_vectors([instance.pk])
+    elif action == "pre_clear":
+        instance._search_record_ids = list(
+            instance.records.values_list("pk", flat=True)
         )
+    elif action == "post_clear":
+        update_search_vectors(getattr(instance, "_search_record_ids", []))
+    elif action in ("post_add", "post_remove"):
+        update_search_vectors(pk_set)
 
 
-def get_days_since_last_addition(TrxCredit, interval_days) -> tuple[date, int]:
-    """Return the date of and the number of days since the
-    last transaction with type 'Addition' stored in the
-    CreditTrx table. This function is called within
-    'create_addition_credits'.
+@receiver(post_save, sender=Song)
+@receiver(post_delete, sender=Song)
+def song_search_changed(sender, instance, **kwargs) -> None:
+    """Listen to saved or deleted songs and rebuild the search
+    document of their record.
     """
-    if TrxCredit.objects.filter(trx_type="Addition").exists():
-        last_addition_date = (
-            TrxCredit.objects.filter(trx_type="Addition")
-            .order_by("-id")
-            .first()
-            .trx_date
-        )
-        days_since_last = (date.today() - last_addition_date).days
-    else:
-        # Prepare for very first addition trx
-        last_addition_date = date.today() - timedelta(days=interval_days)
-        days_since_last = interval_days
+    update_search_vectors([instance.record_id])
+
+
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Label)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=RecordFormat)
+def name_search_post_save(sender, instance, created, **kwargs) -> None:
+    """Listen to renamed artists, labels, genres and formats and
+    rebuild the search document of all their records.
+    """
+    if not created:
+        update_search_vectors(instance.records.values_list("pk", flat=True))
+
 
-    return last_addition_date, days_since_last
+# INVALIDATE THE CACHED CHARTS ON LEDGER CHANGES
+
+
+@receiver(post_save, sender=TrxCredit)
+@receiver(post_delete, sender=TrxCredit)
+def trxcredit_changed(sender, instance, **kwargs) -> None:
+    """Listen to saved or deleted trx and invalidate the cached
+    charts, once the change is committed.
+    """
+    transaction.on_commit(bump_ledger_version)
+
+
+# INVALIDATE THE CACHED FORM CHOICES ON GENRE OR FORMAT CHANGES
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def genre_choices_changed(sender, instance, **kwargs) -> None:
+    transaction.on_commit(genre_choices.invalidate)
+
+
+@receiver(post_save, sender=RecordFormat)
+@receiver(post_delete, sender=RecordFormat)
+def format_choices_changed(sender, instance, **kwargs) -> None:
+    transaction.on_commit(format_choices.invalidate)
 
 
 # DUMP RECORD AND CREATE REMOVAL TRX
@@ -195,11 +561,18 @@ def record_pre_delete(sender, instance, **kwargs) -> None:
     """Listen to a record pre_delete() signal and tigger
     its transfer into the hollow void of ... the dump.
     """
-    send_record_to_dump(instance)
+    dump = send_record_to_dump(instance)
+    # keep the artists for the removal trx, their links are deleted before
+    instance.artists_str = dump.artists
 
 
-def send_record_to_dump(record) -> None:
-    _ = Dump.objects.create(
+def send_record_to_dump(record) -> Dump:
+    """Create a shallow copy of the record in the dump. The display
+    data is re-read in one query, instead of lazily loading format,
+    genre, artists and labels one by one.
+    """
+    record = Record.objects.with_display_data().get(pk=record.pk)
+    return Dump.objects.create(
         legacy_id=record.id,
         title=record.title,
         year=record.year,
@@ -229,14 +602,10 @@ def create_removal_trx(record) -> None:
     of the record to be deleted. This function is called
     everytime before a record is deleted.
     """
-    trx_value = record.credit_value
-    credit_saldo = TrxCredit.objects.order_by("-id").first().credit_saldo
-
-    _ = TrxCredit.objects.create(
+    _ = ledger.append_trx(
         trx_date=date.today(),
         trx_type="Removal",
-        trx_value=trx_value,
-        credit_saldo=credit_saldo + trx_value,
+        trx_value=record.credit_value,
         record=None,  # 'cause the record don't live here anymore ...
         record_string=str(record),
     )
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_disco.settings')
+# see the server profile in settings
+os.environ.setdefault('DJANGO_SERVER_PROFILE', 'asgi')
 
 application = get_asgi_application()
@@ -9,8 +9,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import importlib.util
+import os
+import django
+import plotly
 import yaml
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -68,7 +73,6 @@ INSTALLED_APPS = [
     "crispy_bootstrap5",
     "allauth",
     "allauth.account",
-    "debug_toolbar",
     # Local
     "discobase.apps.DiscobaseConfig",
     "pages.apps.PagesConfig",
@@ -76,6 +80,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "discobase.instrumentation.InstrumentationMiddleware",
+    "discobase.routers.ReplicaPinMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -83,10 +89,17 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     "allauth.account.middleware.AccountMiddleware",
 ]
 
+# the debug toolbar is for development only
+if DEBUG:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("allauth.account.middleware.AccountMiddleware"),
+        "debug_toolbar.middleware.DebugToolbarMiddleware",
+    )
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
@@ -115,6 +128,21 @@ WSGI_APPLICATION = "django_disco.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# connections are reused for CONN_MAX_AGE seconds (0 closes them after every
+# request, null keeps them open) and checked before reuse with health checks
+try:
+    DB_CONN_MAX_AGE = yaml_content["POSTGRES"]["CONN_MAX_AGE"]
+except KeyError:
+    DB_CONN_MAX_AGE = 600
+try:
+    DB_CONN_HEALTH_CHECKS = yaml_content["POSTGRES"]["CONN_HEALTH_CHECKS"]
+except KeyError:
+    DB_CONN_HEALTH_CHECKS = True
+try:
+    DB_POOL = yaml_content["POSTGRES"]["POOL"]
+except KeyError:
+    DB_POOL = False
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -123,9 +151,46 @@ DATABASES = {
         "PASSWORD": yaml_content["POSTGRES"]["PASSWORD"],
         "HOST": yaml_content["POSTGRES"]["HOST"],
         "PORT": yaml_content["POSTGRES"]["PORT"],
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": DB_CONN_HEALTH_CHECKS,
     }
 }
 
+# a connection pool replaces the persistent connections, it needs Django 5.1+
+# with psycopg 3 (POOL can be True or a dict of psycopg_pool.ConnectionPool args)
+if DB_POOL:
+    if django.VERSION < (5, 1) or importlib.util.find_spec("psycopg_pool") is None:
+        raise ImproperlyConfigured(
+            "POSTGRES POOL needs Django 5.1+ with psycopg 3 and psycopg_pool."
+        )
+    DATABASES["default"]["OPTIONS"] = {"pool": DB_POOL}
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+
+# a read replica (see discobase/routers.py): the REPLICA section overrides the
+# settings of the default database (e.g. HOST and PORT). Without one, the
+# replica alias is an unused copy of the default (and its mirror in tests).
+try:
+    DB_REPLICA = yaml_content["POSTGRES"]["REPLICA"]
+except KeyError:
+    DB_REPLICA = None
+
+DATABASES["replica"] = {
+    **DATABASES["default"],
+    **(DB_REPLICA or {}),
+    "TEST": {"MIRROR": "default"},
+}
+DATABASE_ROUTERS = ["discobase.routers.ReplicaRouter"]
+READ_FROM_REPLICA = bool(DB_REPLICA)
+REPLICA_PIN_SECONDS = 5  # to read from the primary after a write
+
+# under ASGI (set by asgi.py) the sync parts of every request, including the
+# queries, run in a new thread, so its connections can not be reused (and
+# there is no connection pool before Django 5.1, see above)
+SERVER_PROFILE = os.environ.get("DJANGO_SERVER_PROFILE", "wsgi")
+if SERVER_PROFILE == "asgi":
+    for database in DATABASES.values():
+        database["CONN_MAX_AGE"] = 0
+
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
 # Password validation
@@ -163,10 +228,68 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.0/howto/static-files/
 
 STATIC_URL = "/static/"
-STATICFILES_DIRS = [BASE_DIR / "static"]
+STATICFILES_DIRS = [
+    BASE_DIR / "static",
+    # serve the plotly.js bundle of the installed plotly version as static file
+    ("plotly", Path(plotly.__file__).parent / "package_data"),
+]
 # TODO this is not suitable for deployment run collectstatic django book 113
 
 
+# Caches
+# The backend of the chart cache can be configured in config_dev, e.g. with
+# BACKEND django.core.cache.backends.redis.RedisCache and a LOCATION. The
+# default is the table discobase_chart_cache in the database (created by
+# migration 0025, other database caches by `manage.py createcachetable`),
+# shared by all processes, so a ledger change invalidates the charts of every
+# worker.
+
+# The default cache (of the search form choices) is a local memory cache per
+# process, so a process only sees the changes of another after the TIMEOUT of
+# its entries. CACHES DEFAULT in config_dev can replace it by a shared backend
+# (with a longer TIMEOUT, e.g. null for none).
+
+try:
+    DEFAULT_CACHE = yaml_content["CACHES"]["DEFAULT"]
+except KeyError:
+    DEFAULT_CACHE = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+try:
+    CHART_CACHE = yaml_content["CACHES"]["CHARTS"]
+except KeyError:
+    CHART_CACHE = {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "discobase_chart_cache",
+    }
+
+CACHES = {
+    "default": {
+        "TIMEOUT": 5 * 60,
+        **DEFAULT_CACHE,
+    },
+    "charts": {
+        "TIMEOUT": 24 * 60 * 60,
+        **CHART_CACHE,
+    },
+}
+
+
+# Request instrumentation (see discobase/instrumentation.py)
+
+try:
+    INSTRUMENTATION_SAMPLES = yaml_content["DJANGO"]["INSTRUMENTATION_SAMPLES"]
+except KeyError:
+    INSTRUMENTATION_SAMPLES = 1000  # per url name
+# the timings reveal details of the backend, only send them when debugging
+try:
+    INSTRUMENTATION_SERVER_TIMING = yaml_content["DJANGO"][
+        "INSTRUMENTATION_SERVER_TIMING"
+    ]
+except KeyError:
+    INSTRUMENTATION_SERVER_TIMING = DEBUG
+
+
 # Media files
 
 MEDIA_URL = "/media/"
@@ -213,3 +336,35 @@ D_CONSUMER_KEY = yaml_content["DISCOGS"]["CONSUMER_KEY"]
 D_CONSUMER_SECRET = yaml_content["DISCOGS"]["CONSUMER_SECRET"]
 D_OAUTH_TOKEN = yaml_content["DISCOGS"]["OAUTH_TOKEN"]
 D_OAUTH_TOKEN_SECRET = yaml_content["DISCOGS"]["OAUTH_TOKEN_SECRET"]
+# the following are optional (e.g. to run against a local fake api)
+try:
+    D_API_URL = yaml_content["DISCOGS"]["API_URL"]
+except KeyError:
+    D_API_URL = "https://api.discogs.com"
+try:
+    D_RATE_LIMIT_PER_MINUTE = yaml_content["DISCOGS"]["RATE_LIMIT_PER_MINUTE"]
+except KeyError:
+    D_RATE_LIMIT_PER_MINUTE = 60  # for authenticated requests
+# on-disk cache of the api responses (see discobase/discogs_cache.py)
+try:
+    D_CACHE_PATH = Path(yaml_content["DISCOGS"]["CACHE_PATH"])
+except KeyError:
+    D_CACHE_PATH = BASE_DIR / "discogs_cache.sqlite3"  # ignored by git
+try:
+    D_CACHE_TTL_DAYS = yaml_content["DISCOGS"]["CACHE_TTL_DAYS"]
+except KeyError:
+    D_CACHE_TTL_DAYS = 30
+try:
+    D_CACHE_MAX_MB = yaml_content["DISCOGS"]["CACHE_MAX_MB"]
+except KeyError:
+    D_CACHE_MAX_MB = 100
+# ambiguous matches of the batch enrichment, to be reviewed (see discogs.py)
+try:
+    D_REVIEW_QUEUE_PATH = Path(yaml_content["DISCOGS"]["REVIEW_QUEUE_PATH"])
+except KeyError:
+    D_REVIEW_QUEUE_PATH = BASE_DIR / "discogs_review_queue.json"  # ignored by git
+
+
+# Cover images (see discobase/covers.py)
+
+COVER_RENDITION_FORMAT = "WEBP"  # or "AVIF", if supported by Pillow
@@ -0,0 +1,63 @@
+// Draw the credit saldo chart from the columnar json of the
+// trxcredit_series api (see discobase/charts.py for the format).
+
+const TRX_COLORS = { Addition: "green", Removal: "red", Purchase: "blue" };
+
+function drawTrxCreditChart(container, series) {
+    const traces = [
+        {
+            x: series.date,
+            y: series.saldo,
+            mode: "lines",
+            line: { color: "lightgray" },
+            showlegend: false,
+        },
+    ];
+
+    series.types.forEach((trxType, code) => {
+        const rows = [];
+        series.type.forEach((rowCode, i) => {
+            if (rowCode === code) rows.push(i);
+        });
+        const pick = (column) => rows.map((i) => column[i]);
+        traces.push({
+            x: pick(series.date),
+            y: pick(series.saldo),
+            mode: "markers",
+            marker: { color: TRX_COLORS[trxType] || "gray" },
+            name: trxType,
+            customdata: rows.map((i) => [
+                series.id[i],
+                series.record_id[i] ?? "None",
+                series.record[i] ?? "None",
+                trxType,
+            ]),
+            hovertemplate: "%{x}<br>"
+                + "Saldo: %{y}<br>"
+                + "Trx Id: %{customdata[0]}<br>"
+                + "Record Id: %{customdata[1]}<br>"
+                + "Record: %{customdata[2]}<br>"
+                + "<extra>%{customdata[3]}</extra>",
+        });
+    });
+
+    // the series is ordered by date
+    const dates = series.date;
+    const title = dates.length
+        ? `Credit Saldo Movement, ${dates[0]} to ${dates[dates.length - 1]}`
+        : "Credit Saldo Movement, no trx in this period";
+
+    Plotly.newPlot(container, traces, {
+        title: { text: title },
+        xaxis: { title: { text: "Date" } },
+        yaxis: { title: { text: "Credit Saldo" } },
+        legend: { title: { text: "Trx Types" } },
+    });
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+    const container = document.getElementById("trxcredit-chart");
+    fetch(container.dataset.seriesUrl)
+        .then((response) => response.json())
+        .then((series) => drawTrxCreditChart(container, series));
+});